@@ -1,18 +1,28 @@
 # =========================
 # Imports and Configuration
 # =========================
+import asyncio
 import logging
 import os
 import json
 import re
 import random
+import time
+import heapq
 import html
+import itertools
 import traceback
 from typing import Final
 import uuid
-from telegram import Update, User, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackContext, CallbackQueryHandler, ConversationHandler
+from collections import namedtuple
+from functools import lru_cache
+from telegram import Update, User, ChatPermissions, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, InputMediaVideo
+from telegram.ext import Application, BaseUpdateProcessor, ChatMemberHandler, PersistenceInput, PicklePersistence, CommandHandler, MessageHandler, filters, ContextTypes, CallbackContext, CallbackQueryHandler, ConversationHandler
 from telegram.constants import ChatMemberStatus
+try:
+    import orjson  # Much faster JSON (de)serialization when available
+except ImportError:
+    orjson = None
 
 # =========================
 # Logging Configuration
@@ -43,6 +53,7 @@ BOT_USERNAME: Final = '@MasterBeanoBot'  # Bot's username (update if needed)
 # File paths for persistent data storage
 HASHTAG_DATA_FILE = 'hashtag_data.json'  # Stores hashtagged messages/media
 ADMIN_DATA_FILE = 'admins.json'          # Stores admin/owner info
+PERSISTENCE_FILE = 'bot_state.pickle'    # Stores in-progress conversation state (user_data) across restarts
 from functools import wraps
 OWNER_ID = 7237569475  # Your Telegram ID (change to your actual Telegram user ID)
 
@@ -69,14 +80,12 @@ def command_handler_wrapper(admin_only=False):
                 # Check if the command is disabled
                 if chat.type in ['group', 'supergroup']:
                     command_name = func.__name__.replace('_command', '')
-                    disabled_cmds = set(load_disabled_commands().get(str(chat.id), []))
-                    if command_name in disabled_cmds:
+                    if command_name in get_disabled_commands(chat.id):
                         logger.info(f"Command '{command_name}' is disabled in group {chat.id}. Aborting.")
                         return # Silently abort if command is disabled
 
                 if admin_only and chat.type in ['group', 'supergroup']:
-                    member = await context.bot.get_chat_member(chat.id, user.id)
-                    if member.status not in [ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER]:
+                    if not await is_chat_admin(context.bot, chat.id, user.id):
                         await update.message.reply_text(
                             f"Warning: {user.mention_html()}, you are not authorized to use this command.",
                             parse_mode='HTML'
@@ -99,20 +108,188 @@ def command_handler_wrapper(admin_only=False):
     return decorator
 
 
+# Caps concurrent Telegram API calls so fan-outs stay under the flood limits
+BOT_API_CONCURRENCY = 20
+BOT_API_SEM = asyncio.Semaphore(BOT_API_CONCURRENCY)
+
+def limited(func):
+    """Runs the wrapped coroutine while holding a slot of BOT_API_SEM."""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        async with BOT_API_SEM:
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+# Updates handled at once across all chats
+MAX_CONCURRENT_UPDATES = 64
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Handles updates from different chats concurrently while keeping each chat's updates in order."""
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        # chat id -> [lock, updates holding or waiting on it], only for chats with updates in flight
+        self._chat_locks = {}
+
+    async def do_process_update(self, update, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await coroutine
+            return
+        entry = self._chat_locks.get(chat.id)
+        if entry is None:
+            entry = self._chat_locks[chat.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            # Nothing holds or waits on the lock any more, so forget the chat
+            if not entry[1]:
+                del self._chat_locks[chat.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+# =============================
+# JSON Storage Helpers
+# =============================
+# Parsed JSON files keyed by path, as (st_mtime_ns or None if missing, data)
+_JSON_CACHE = {}
+# Files changed in memory but not yet written, and files being written right now
+_DIRTY = set()
+_FLUSHING = set()
+# Seconds between flushes of deferred writes
+JSON_FLUSH_INTERVAL = 0.2
+# Machine-only files written without indentation
+_COMPACT_JSON_FILES = set()
+
+def _dumps(path, data) -> bytes:
+    """Serializes data for path as UTF-8 JSON, indented unless the file is in _COMPACT_JSON_FILES."""
+    pretty = path not in _COMPACT_JSON_FILES
+    if orjson is not None:
+        return orjson.dumps(data, option=(orjson.OPT_INDENT_2 if pretty else 0) | orjson.OPT_NON_STR_KEYS)
+    if pretty:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+def _cache_lookup(path):
+    """Returns (current st_mtime_ns or None, cached data or None if the file needs to be read)."""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    cached = _JSON_CACHE.get(path)
+    if cached is not None and (cached[0] == mtime or path in _DIRTY or path in _FLUSHING):
+        # Unflushed changes in memory win over whatever is on disk
+        return mtime, cached[1]
+    return mtime, None
+
+def _read_json(path):
+    with open(path, 'rb') as f:
+        return _loads(f.read())
+
+def _cached_load(path, default_factory=dict):
+    """
+    Returns the parsed contents of a JSON data file, re-reading it only when its mtime changes.
+    The returned object is shared: mutate it and pass it to the matching save_* function.
+    """
+    mtime, data = _cache_lookup(path)
+    if data is not None:
+        return data
+    data = default_factory() if mtime is None else _read_json(path)
+    _JSON_CACHE[path] = (mtime, data)
+    return data
+
+async def _aload_json(path, default_factory=dict):
+    """Like _cached_load, but parses a changed file in a worker thread instead of on the event loop."""
+    mtime, data = _cache_lookup(path)
+    if data is not None:
+        return data
+    data = default_factory() if mtime is None else await asyncio.to_thread(_read_json, path)
+    # A handler may have loaded (and changed) the file while we were reading it; its copy wins
+    cached = _JSON_CACHE.get(path)
+    if cached is not None and (cached[0] == mtime or path in _DIRTY or path in _FLUSHING):
+        return cached[1]
+    _JSON_CACHE[path] = (mtime, data)
+    return data
+
+def _save_json(path, data):
+    """Writes a JSON data file and refreshes its cache entry."""
+    _write_bytes(path, _dumps(path, data))
+    _JSON_CACHE[path] = (os.stat(path).st_mtime_ns, data)
+    _DIRTY.discard(path)
+
+async def _asave_json(path, data):
+    """Like _save_json, but writes the file in a worker thread instead of on the event loop."""
+    # Serialize on the event loop so handlers can't mutate the data mid-dump
+    payload = _dumps(path, data)
+    _JSON_CACHE[path] = (_JSON_CACHE.get(path, (None,))[0], data)
+    # The payload covers every change so far; a _mark_dirty during the write re-adds the path
+    was_dirty = path in _DIRTY
+    _DIRTY.discard(path)
+    _FLUSHING.add(path)
+    try:
+        await asyncio.to_thread(_write_bytes, path, payload)
+        _JSON_CACHE[path] = (os.stat(path).st_mtime_ns, _JSON_CACHE[path][1])
+    except Exception:
+        if was_dirty:
+            _DIRTY.add(path)
+        raise
+    finally:
+        _FLUSHING.discard(path)
+
+def _mark_dirty(path, data):
+    """Stores data as the current contents of path; flush_dirty_json writes it out shortly after."""
+    cached = _JSON_CACHE.get(path)
+    _JSON_CACHE[path] = (cached[0] if cached else None, data)
+    _DIRTY.add(path)
+
+def _write_bytes(path, payload):
+    """Writes payload to a temp file and swaps it into place, so readers and crashes never see a partial file."""
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp, path)
+
+async def flush_dirty_json():
+    """Writes every file marked dirty to disk, doing the file I/O in a worker thread."""
+    while _DIRTY:
+        path = _DIRTY.pop()
+        _FLUSHING.add(path)
+        try:
+            data = _JSON_CACHE[path][1]
+            # Serialize on the event loop so handlers can't mutate the data mid-dump
+            payload = _dumps(path, data)
+            await asyncio.to_thread(_write_bytes, path, payload)
+            _JSON_CACHE[path] = (os.stat(path).st_mtime_ns, _JSON_CACHE[path][1])
+        except Exception:
+            logger.exception(f"Failed to write {path}, will retry")
+            _DIRTY.add(path)
+            break
+        finally:
+            _FLUSHING.discard(path)
+
+
 # =============================
 # Admin/Owner Data Management
 # =============================
 ADMIN_NICKNAMES_FILE = 'admin_nicknames.json'
 
 def load_admin_nicknames():
-    if os.path.exists(ADMIN_NICKNAMES_FILE):
-        with open(ADMIN_NICKNAMES_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    return _cached_load(ADMIN_NICKNAMES_FILE)
 
-def save_admin_nicknames(data):
-    with open(ADMIN_NICKNAMES_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+async def asave_admin_nicknames(data):
+    await _asave_json(ADMIN_NICKNAMES_FILE, data)
+    _invalidate_admin_view()
 
 @command_handler_wrapper(admin_only=True)
 async def setnickname_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -127,11 +304,7 @@ async def setnickname_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     target_identifier = context.args[0]
     nickname = " ".join(context.args[1:])
 
-    target_id = None
-    if target_identifier.isdigit():
-        target_id = int(target_identifier)
-    else:
-        target_id = await get_user_id_by_username(context, update.effective_chat.id, target_identifier)
+    target_id = await resolve_user_id(context, update.effective_chat.id, target_identifier)
 
     if not target_id:
         await update.message.reply_text(f"Could not find user {target_identifier}.")
@@ -143,85 +316,171 @@ async def setnickname_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     nicknames = load_admin_nicknames()
     nicknames[str(target_id)] = nickname
-    save_admin_nicknames(nicknames)
+    await asave_admin_nicknames(nicknames)
 
     await update.message.reply_text(f"Nickname for user {target_id} has been set to '{nickname}'.")
 
 def load_admin_data():
     """Load admin and owner data from file. Ensures owner is always in admin list."""
-    if os.path.exists(ADMIN_DATA_FILE):
-        with open(ADMIN_DATA_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            # Always ensure owner is in admin list
-            if str(OWNER_ID) not in data.get('admins', []):
-                data['admins'] = list(set(data.get('admins', []) + [str(OWNER_ID)]))
-            data['owner'] = str(OWNER_ID)
-            logger.debug(f"Loaded admin data: {data}")
-            return data
     # Default: owner is admin
-    logger.debug("No admin data file found, using default owner as admin.")
-    return {'owner': str(OWNER_ID), 'admins': [str(OWNER_ID)]}
+    data = _cached_load(ADMIN_DATA_FILE, lambda: {'owner': str(OWNER_ID), 'admins': [str(OWNER_ID)]})
+    # Admins are kept as a frozenset in memory (converted once per file read); always include the owner
+    if not isinstance(data.get('admins'), frozenset):
+        data['admins'] = frozenset(data.get('admins', ())) | {str(OWNER_ID)}
+    data['owner'] = str(OWNER_ID)
+    return data
 
 def save_admin_data(data):
     """Save admin and owner data to file. Ensures owner is always in admin list."""
-    # Always ensure owner is in admin list
-    if str(data['owner']) not in data['admins']:
-        data['admins'].append(str(data['owner']))
-    with open(ADMIN_DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # Always ensure owner is in admin list; the file stores admins as a list
+    admins = set(data['admins']) | {str(data['owner'])}
+    _save_json(ADMIN_DATA_FILE, {**data, 'admins': sorted(admins)})
+    _invalidate_admin_view()
     logger.debug(f"Saved admin data: {data}")
 
+# Admin ids, owner id and nicknames in lookup-ready form
+AdminView = namedtuple('AdminView', ['admins', 'owner', 'nicknames'])
+# (file mtimes the view was built from, view)
+_admin_view_cache = None
+
+def _invalidate_admin_view():
+    global _admin_view_cache
+    _admin_view_cache = None
+
+def _admin_view() -> AdminView:
+    """Returns the admin view, rebuilding it only when the admin or nickname files change."""
+    global _admin_view_cache
+    data = load_admin_data()
+    nicknames = load_admin_nicknames()
+    key = (_JSON_CACHE[ADMIN_DATA_FILE][0], _JSON_CACHE[ADMIN_NICKNAMES_FILE][0])
+    if _admin_view_cache is None or _admin_view_cache[0] != key:
+        view = AdminView(data['admins'] | {data['owner']}, data['owner'], dict(nicknames))
+        _admin_view_cache = (key, view)
+    return _admin_view_cache[1]
+
 def is_owner(user_id):
     """Check if the user is the owner."""
-    data = load_admin_data()
-    result = str(user_id) == str(data['owner'])
-    logger.debug(f"is_owner({user_id}) -> {result}")
-    return result
+    return str(user_id) == _admin_view().owner
 
 def get_display_name(user_id: int, full_name: str) -> str:
     """
     Determines the display name for a user based on their admin status and nickname.
     """
-    if not is_admin(user_id):
+    view = _admin_view()
+    user_id = str(user_id)
+    if user_id not in view.admins:
         return "fag"
+    return view.nicknames.get(user_id, full_name)
 
-    nicknames = load_admin_nicknames()
-    return nicknames.get(str(user_id), full_name)
+def is_f_name(name: str) -> bool:
+    """Whether a display name carries the tag, in any letter case."""
+    return 'fag' in name.casefold()
+
+def sentence_subject(name: str, is_f: bool = None) -> str:
+    """Formats a display name to open a sentence; pass is_f when the flag is already known."""
+    if is_f is None:
+        is_f = is_f_name(name)
+    if is_f:
+        return f"The {name}"
+    # Only the first letter; the rest keeps the casing the nickname was stored with
+    return name if name[:1].isupper() else name[:1].upper() + name[1:]
 
 def is_admin(user_id):
     """Check if the user is an admin or the owner."""
-    data = load_admin_data()
-    result = str(user_id) in data['admins'] or str(user_id) == str(data['owner'])
-    logger.debug(f"is_admin({user_id}) -> {result}")
-    return result
+    return str(user_id) in _admin_view().admins
+
+# Seconds a chat's administrator list is reused before it is fetched again
+ADMIN_CACHE_TTL = 60
+# chat id -> (monotonic time fetched, administrators, lowercase username -> user id, admin user ids)
+_ADMIN_CACHE = {}
+
+async def _admin_cache_entry(bot, chat_id, ttl=ADMIN_CACHE_TTL):
+    chat_id = int(chat_id)
+    cached = _ADMIN_CACHE.get(chat_id)
+    if cached and time.monotonic() - cached[0] < ttl:
+        return cached
+    async with BOT_API_SEM:
+        admins = await bot.get_chat_administrators(chat_id)
+    usernames = {member.user.username.lower(): member.user.id for member in admins if member.user.username}
+    cached = (time.monotonic(), admins, usernames, frozenset(member.user.id for member in admins))
+    _ADMIN_CACHE[chat_id] = cached
+    return cached
+
+async def cached_get_admins(bot, chat_id, ttl=ADMIN_CACHE_TTL):
+    """Returns a chat's administrators, reusing the last result for up to ttl seconds."""
+    return (await _admin_cache_entry(bot, chat_id, ttl))[1]
+
+async def is_chat_admin(bot, chat_id, user_id) -> bool:
+    """Whether the user is an administrator or the owner of the chat, from the cached admin list."""
+    return int(user_id) in (await _admin_cache_entry(bot, chat_id))[3]
+
+async def chat_member_update_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Drops a chat's cached admin list as soon as someone is promoted, demoted or an admin leaves."""
+    change = update.chat_member
+    admin_statuses = (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+    if change.old_chat_member.status in admin_statuses or change.new_chat_member.status in admin_statuses:
+        _ADMIN_CACHE.pop(change.chat.id, None)
+
+CHAT_MEMBER_TTL = 300
+# (chat id, user id) -> (monotonic time fetched, ChatMember)
+_CHAT_MEMBER_CACHE = {}
+
+async def cached_get_chat_member(bot, chat_id, user_id, ttl=CHAT_MEMBER_TTL):
+    """Returns a chat member for name lookups, reusing the last result for up to ttl seconds."""
+    key = (int(chat_id), int(user_id))
+    cached = _CHAT_MEMBER_CACHE.get(key)
+    if cached and time.monotonic() - cached[0] < ttl:
+        return cached[1]
+    async with BOT_API_SEM:
+        member = await bot.get_chat_member(*key)
+    _CHAT_MEMBER_CACHE[key] = (time.monotonic(), member)
+    return member
+
+@limited
+async def send_limited_message(bot, chat_id, text: str, **kwargs):
+    """bot.send_message, holding a BOT_API_SEM slot."""
+    return await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+
+async def notify_admins(bot, admins, text: str, reason: str, **kwargs):
+    """Messages every admin concurrently and logs the ones that could not be reached."""
+    results = await asyncio.gather(
+        *(send_limited_message(bot, admin.user.id, text, **kwargs) for admin in admins),
+        return_exceptions=True
+    )
+    for admin, result in zip(admins, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Failed to notify admin {admin.user.id} about {reason}.")
 
 async def get_user_id_by_username(context, chat_id, username) -> str:
     """Get a user's Telegram ID by their username in a chat."""
-    async for member in context.bot.get_chat_administrators(chat_id):
-        if member.user.username and member.user.username.lower() == username.lower().lstrip('@'):
-            logger.debug(f"Found user ID {member.user.id} for username {username}")
-            return str(member.user.id)
-    logger.debug(f"Username {username} not found in chat {chat_id}")
-    return None
+    usernames = (await _admin_cache_entry(context.bot, chat_id))[2]
+    user_id = usernames.get(username.lower().lstrip('@'))
+    if user_id is None:
+        logger.debug(f"Username {username} not found in chat {chat_id}")
+        return None
+    logger.debug(f"Found user ID {user_id} for username {username}")
+    return str(user_id)
+
+async def resolve_user_id(context, chat_id, identifier) -> int:
+    """Resolves a numeric user ID or an @username to an int user ID, or None if it can't be found."""
+    user_id = parse_int(identifier)
+    if user_id is not None:
+        return user_id
+    user_id = await get_user_id_by_username(context, chat_id, identifier)
+    return int(user_id) if user_id is not None else None
 
 # =============================
 # Hashtag Data Management
 # =============================
 def load_hashtag_data():
     """Load hashtagged message/media data from file."""
-    if os.path.exists(HASHTAG_DATA_FILE):
-        with open(HASHTAG_DATA_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            logger.debug(f"Loaded hashtag data: {list(data.keys())}")
-            return data
-    logger.debug("No hashtag data file found, returning empty dict.")
-    return {}
+    return _cached_load(HASHTAG_DATA_FILE)
 
 def save_hashtag_data(data):
     """Save hashtagged message/media data to file."""
-    with open(HASHTAG_DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    logger.debug(f"Saved hashtag data: {list(data.keys())}")
+    # Written on every hashtagged message, so batch the writes like the other hot files
+    _mark_dirty(HASHTAG_DATA_FILE, data)
+    logger.debug(f"Saved hashtag data: {len(data)} tags")
 
 import asyncio
 import time
@@ -234,53 +493,78 @@ REWARDS_DATA_FILE = 'rewards.json'  # Stores rewards per group
 DEFAULT_REWARD = {"name": "Other", "cost": 0}
 
 def load_rewards_data():
-    if os.path.exists(REWARDS_DATA_FILE):
-        with open(REWARDS_DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    data = _cached_load(REWARDS_DATA_FILE)
+    # One-shot migration from the old per-group list of rewards to a dict keyed by lowercase name
+    legacy_groups = [group_id for group_id, rewards in data.items() if isinstance(rewards, list)]
+    if legacy_groups:
+        for group_id in legacy_groups:
+            data[group_id] = {r["name"].lower(): r for r in data[group_id]}
+        save_rewards_data(data)
+        logger.info(f"Migrated rewards for groups {legacy_groups} to the keyed format")
+    return data
 
 def save_rewards_data(data):
-    with open(REWARDS_DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    _save_json(REWARDS_DATA_FILE, data)
+    _REWARD_VIEWS.clear()
 
-def get_rewards_list(group_id):
+# A group's rewards in display order, plus the HTML listings built from them
+RewardsView = namedtuple('RewardsView', ['rewards', 'priced_html', 'names_html'])
+# group id -> (rewards.json mtime, RewardsView)
+_REWARD_VIEWS = {}
+
+def get_rewards_view(group_id) -> RewardsView:
+    """Returns a group's RewardsView, rebuilding it only when rewards.json changes."""
     data = load_rewards_data()
+    mtime = _JSON_CACHE[REWARDS_DATA_FILE][0]
     group_id = str(group_id)
-    rewards = data.get(group_id, [])
-    # Always include the default "Other" reward at the end
-    if not any(r["name"].lower() == "other" for r in rewards):
-        rewards.append(DEFAULT_REWARD)
-    return rewards
+    cached = _REWARD_VIEWS.get(group_id)
+    if cached is None or cached[0] != mtime:
+        group_rewards = data.get(group_id, {})
+        # Always include the default "Other" reward at the end
+        rewards = tuple(group_rewards.values()) + (() if "other" in group_rewards else (DEFAULT_REWARD,))
+        names = [html.escape(r['name']) for r in rewards]
+        cached = (mtime, RewardsView(
+            rewards,
+            "".join(f"• <b>{name}</b> — {r['cost']} points\n" for name, r in zip(names, rewards)),
+            "".join(f"• <b>{name}</b>\n" for name in names),
+        ))
+        _REWARD_VIEWS[group_id] = cached
+    return cached[1]
+
+def get_reward(group_id, name):
+    """Returns the group's reward with the given name (case-insensitive), or None."""
+    name_key = name.strip().lower()
+    reward = load_rewards_data().get(str(group_id), {}).get(name_key)
+    if reward is None and name_key == "other":
+        return DEFAULT_REWARD
+    return reward
 
 def add_reward(group_id, name, cost):
-    if name.strip().lower() == "other":
+    name = name.strip()
+    name_key = name.lower()
+    if name_key == "other":
         return False
     data = load_rewards_data()
-    group_id = str(group_id)
-    if group_id not in data:
-        data[group_id] = []
+    group_rewards = data.setdefault(str(group_id), {})
     # Prevent duplicates
-    for r in data[group_id]:
-        if r["name"].lower() == name.strip().lower():
-            return False
-    data[group_id].append({"name": name.strip(), "cost": int(cost)})
+    if name_key in group_rewards:
+        return False
+    group_rewards[name_key] = {"name": name, "cost": int(cost)}
     save_rewards_data(data)
     logger.debug(f"Added reward '{name}' with cost {cost} to group {group_id}")
     return True
 
 def remove_reward(group_id, name):
-    if name.strip().lower() == "other":
+    name_key = name.strip().lower()
+    if name_key == "other":
         return False
     data = load_rewards_data()
-    group_id = str(group_id)
-    if group_id not in data:
+    group_rewards = data.get(str(group_id))
+    if not group_rewards or group_rewards.pop(name_key, None) is None:
         return False
-    before = len(data[group_id])
-    data[group_id] = [r for r in data[group_id] if r["name"].lower() != name.strip().lower()]
-    after = len(data[group_id])
     save_rewards_data(data)
     logger.debug(f"Removed reward '{name}' from group {group_id}")
-    return before != after
+    return True
 
 # =============================
 # Point System Storage & Helpers
@@ -288,14 +572,13 @@ def remove_reward(group_id, name):
 POINTS_DATA_FILE = 'points.json'  # Stores user points per group
 
 def load_points_data():
-    if os.path.exists(POINTS_DATA_FILE):
-        with open(POINTS_DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    return _cached_load(POINTS_DATA_FILE)
 
 def save_points_data(data):
-    with open(POINTS_DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    _mark_dirty(POINTS_DATA_FILE, data)
+
+async def aload_points_data():
+    return await _aload_json(POINTS_DATA_FILE)
 
 def get_user_points(group_id, user_id):
     data = load_points_data()
@@ -314,7 +597,7 @@ def set_user_points(group_id, user_id, points):
     logger.debug(f"Set points for user {user_id} in group {group_id} to {points}")
 
 async def check_for_punishment(group_id, user_id, context: ContextTypes.DEFAULT_TYPE):
-    punishments_data = load_punishments_data()
+    punishments_data = await aload_punishments_data()
     group_id_str = str(group_id)
 
     if group_id_str not in punishments_data:
@@ -324,7 +607,7 @@ async def check_for_punishment(group_id, user_id, context: ContextTypes.DEFAULT_
     user_points = get_user_points(group_id, user_id)
     triggered_punishments = get_triggered_punishments_for_user(group_id, user_id)
 
-    for punishment in group_punishments:
+    for punishment in group_punishments.values():
         threshold = punishment.get("threshold")
         message = punishment.get("message")
 
@@ -343,15 +626,12 @@ async def check_for_punishment(group_id, user_id, context: ContextTypes.DEFAULT_
                 )
 
                 chat = await context.bot.get_chat(group_id)
-                admins = await context.bot.get_chat_administrators(group_id)
-                for admin in admins:
-                    try:
-                        await context.bot.send_message(
-                            chat_id=admin.user.id,
-                            text=f"User {display_name} (ID: {user_id}) in group {chat.title} (ID: {group_id}) triggered punishment '{message}' by falling below {threshold} points."
-                        )
-                    except Exception:
-                        logger.warning(f"Failed to notify admin {admin.user.id} about punishment.")
+                admins = await cached_get_admins(context.bot, group_id)
+                await notify_admins(
+                    context.bot, admins,
+                    f"User {display_name} (ID: {user_id}) in group {chat.title} (ID: {group_id}) triggered punishment '{message}' by falling below {threshold} points.",
+                    "punishment"
+                )
 
                 add_triggered_punishment_for_user(group_id, user_id, message)
         else:
@@ -360,13 +640,16 @@ async def check_for_punishment(group_id, user_id, context: ContextTypes.DEFAULT_
                 remove_triggered_punishment_for_user(group_id, user_id, message)
 
 async def add_user_points(group_id, user_id, delta, context: ContextTypes.DEFAULT_TYPE):
-    points = get_user_points(group_id, user_id) + delta
-    set_user_points(group_id, user_id, points)
+    data = await aload_points_data()
+    group_points = data.setdefault(str(group_id), {})
+    points = group_points.get(str(user_id), 0) + delta
+    group_points[str(user_id)] = points
+    save_points_data(data)
     logger.debug(f"Added {delta} points for user {user_id} in group {group_id} (new total: {points})")
 
     # If user's points are non-negative, reset their negative strike counter for this group.
     if points >= 0:
-        tracker = load_negative_tracker()
+        tracker = await aload_negative_tracker()
         group_id_str = str(group_id)
         user_id_str = str(user_id)
         if group_id_str in tracker and user_id_str in tracker.get(group_id_str, {}):
@@ -383,20 +666,20 @@ async def add_user_points(group_id, user_id, delta, context: ContextTypes.DEFAUL
 # Negative Points Tracker
 # =============================
 NEGATIVE_POINTS_TRACKER_FILE = 'negative_points_tracker.json'
-
-def load_negative_tracker():
-    if os.path.exists(NEGATIVE_POINTS_TRACKER_FILE):
-        with open(NEGATIVE_POINTS_TRACKER_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+_COMPACT_JSON_FILES.add(NEGATIVE_POINTS_TRACKER_FILE)
 
 def save_negative_tracker(data):
-    with open(NEGATIVE_POINTS_TRACKER_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    _mark_dirty(NEGATIVE_POINTS_TRACKER_FILE, data)
+
+async def aload_negative_tracker():
+    return await _aload_json(NEGATIVE_POINTS_TRACKER_FILE)
+
+# Permissions applied when a user is muted for negative points
+MUTED_PERMISSIONS = ChatPermissions(can_send_messages=False)
 
 async def check_for_negative_points(group_id, user_id, points, context: ContextTypes.DEFAULT_TYPE):
     if points < 0:
-        tracker = load_negative_tracker()
+        tracker = await aload_negative_tracker()
         group_id_str = str(group_id)
         user_id_str = str(user_id)
 
@@ -417,8 +700,8 @@ async def check_for_negative_points(group_id, user_id, points, context: ContextT
                 await context.bot.restrict_chat_member(
                     chat_id=group_id,
                     user_id=user_id,
-                    permissions={'can_send_messages': False},
-                    until_date=time.time() + 86400  # 24 hours
+                    permissions=MUTED_PERMISSIONS,
+                    until_date=int(time.time()) + 86400  # 24 hours
                 )
                 set_user_points(group_id, user_id, 0) # Reset points to 0
                 await context.bot.send_message(
@@ -434,36 +717,30 @@ async def check_for_negative_points(group_id, user_id, points, context: ContextT
             save_negative_tracker(tracker)
 
             chat = await context.bot.get_chat(group_id)
-            admins = await context.bot.get_chat_administrators(group_id)
+            admins = await cached_get_admins(context.bot, group_id)
             await context.bot.send_message(
                 chat_id=group_id,
                 text=f"🚨 <b>Third Strike!</b> 🚨\n{user_mention} has reached negative points for the third time. A special punishment from the admins is coming, and you are not allowed to refuse if you wish to remain in the group.",
                 parse_mode='HTML'
             )
-            for admin in admins:
-                try:
-                    await context.bot.send_message(
-                        chat_id=admin.user.id,
-                        text=f"User {user_mention} in group '{chat.title}' has reached negative points for the third time and requires a special punishment. Their strike counter has been reset.",
-                        parse_mode='HTML'
-                    )
-                except Exception:
-                    logger.warning(f"Failed to notify admin {admin.user.id} about 3rd strike.")
+            await notify_admins(
+                context.bot, admins,
+                f"User {user_mention} in group '{chat.title}' has reached negative points for the third time and requires a special punishment. Their strike counter has been reset.",
+                "3rd strike",
+                parse_mode='HTML'
+            )
 
 # =============================
 # Chance Game Helpers
 # =============================
 CHANCE_COOLDOWNS_FILE = 'chance_cooldowns.json'
+_COMPACT_JSON_FILES.add(CHANCE_COOLDOWNS_FILE)
 
 def load_cooldowns():
-    if os.path.exists(CHANCE_COOLDOWNS_FILE):
-        with open(CHANCE_COOLDOWNS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    return _cached_load(CHANCE_COOLDOWNS_FILE)
 
 def save_cooldowns(data):
-    with open(CHANCE_COOLDOWNS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    _mark_dirty(CHANCE_COOLDOWNS_FILE, data)
 
 def get_last_played(user_id):
     cooldowns = load_cooldowns()
@@ -474,91 +751,182 @@ def set_last_played(user_id):
     cooldowns[str(user_id)] = time.time()
     save_cooldowns(cooldowns)
 
+# Chance game outcomes and their relative weights
+CHANCE_OUTCOMES = [
+    ("plus_50", 15),
+    ("minus_100", 15),
+    ("chastity_2_days", 15),
+    ("chastity_7_days", 5),
+    ("nothing", 30),
+    ("free_reward", 10),
+    ("lose_all_points", 2.5),
+    ("double_points", 2.5),
+    ("ask_task", 5),
+]
+_CHANCE_NAMES = [name for name, _ in CHANCE_OUTCOMES]
+_CHANCE_CUM_WEIGHTS = list(itertools.accumulate(weight for _, weight in CHANCE_OUTCOMES))
+
 def get_chance_outcome():
     """
     Returns a random outcome for the chance game based on weighted probabilities.
     """
-    outcomes = [
-        {"name": "plus_50", "weight": 15},
-        {"name": "minus_100", "weight": 15},
-        {"name": "chastity_2_days", "weight": 15},
-        {"name": "chastity_7_days", "weight": 5},
-        {"name": "nothing", "weight": 30},
-        {"name": "free_reward", "weight": 10},
-        {"name": "lose_all_points", "weight": 2.5},
-        {"name": "double_points", "weight": 2.5},
-        {"name": "ask_task", "weight": 5},
-    ]
-
-    total_weight = sum(o['weight'] for o in outcomes)
-    random_num = random.uniform(0, total_weight)
-
-    current_weight = 0
-    for outcome in outcomes:
-        current_weight += outcome['weight']
-        if random_num <= current_weight:
-            return outcome['name']
+    return random.choices(_CHANCE_NAMES, cum_weights=_CHANCE_CUM_WEIGHTS, k=1)[0]
 
 # =============================
 # Game System Storage & Helpers
 # =============================
 GAMES_DATA_FILE = 'games.json'
+# Rewritten on every move; indenting the 10x10 boards puts every cell on its own line
+_COMPACT_JSON_FILES.add(GAMES_DATA_FILE)
 
 def load_games_data():
-    if os.path.exists(GAMES_DATA_FILE):
-        with open(GAMES_DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    return _cached_load(GAMES_DATA_FILE)
 
 def save_games_data(data):
-    with open(GAMES_DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # Saved on every move, so batch the writes like the other hot files
+    _mark_dirty(GAMES_DATA_FILE, data)
+
+# Per-game state that only matters while a game is being played
+GAME_RUNTIME_KEYS = ('board', 'bitboards', 'boards', 'ships', 'ship_at', 'placement_complete', 'last_roll', 'turn')
+
+def mark_game_complete(game: dict):
+    """Marks a game as complete and drops its in-play state so it no longer bloats games.json."""
+    game['status'] = 'complete'
+    for key in GAME_RUNTIME_KEYS:
+        game.pop(key, None)
+
+def get_opponent_id(game: dict, user_id: int) -> int:
+    """Returns the other player's id. Player ids are stored as ints; only board/ship dict keys are strings."""
+    return game['opponent_id'] if user_id == game['challenger_id'] else game['challenger_id']
+
+def _active_games_index(context: ContextTypes.DEFAULT_TYPE, games_data: dict) -> dict:
+    """Returns the user id -> active game ids index kept in bot_data, building it from games_data on first use."""
+    index = context.bot_data.get('active_games_by_user')
+    if index is None:
+        index = {}
+        for game_id, game in games_data.items():
+            if game.get('status') == 'active':
+                for role in ('challenger_id', 'opponent_id'):
+                    index.setdefault(int(game[role]), set()).add(game_id)
+        context.bot_data['active_games_by_user'] = index
+    return index
+
+def index_active_game(context: ContextTypes.DEFAULT_TYPE, games_data: dict, game_id: str):
+    """Records a newly activated game against both of its players."""
+    index = _active_games_index(context, games_data)
+    game = games_data[game_id]
+    for role in ('challenger_id', 'opponent_id'):
+        index.setdefault(int(game[role]), set()).add(game_id)
+
+def active_game_ids(context: ContextTypes.DEFAULT_TYPE, games_data: dict, user_id: int) -> list:
+    """Returns the ids of the active games the user is playing."""
+    game_ids = _active_games_index(context, games_data).get(int(user_id))
+    if not game_ids:
+        return []
+    active = []
+    for game_id in list(game_ids):
+        game = games_data.get(game_id)
+        if not game or game.get('status') != 'active':
+            # Finished or deleted since it was indexed
+            game_ids.discard(game_id)
+        else:
+            active.append(game_id)
+    return active
+
+def find_active_game_id(context: ContextTypes.DEFAULT_TYPE, games_data: dict, user_id: int, game_type: str = None):
+    """Returns the id of an active game the user is playing (optionally of one type), or None."""
+    for game_id in active_game_ids(context, games_data, user_id):
+        if game_type is None or games_data[game_id].get('game_type') == game_type:
+            return game_id
+    return None
 
 
 # =============================
 # Game Logic Helpers
 # =============================
+# Bot method used to post each kind of media (stakes, forwarded help request media)
+MEDIA_SEND_METHODS = {'photo': 'send_photo', 'video': 'send_video', 'voice': 'send_voice'}
+
+@limited
+async def send_stake_media(bot, chat_id, stake: dict, caption: str):
+    """Posts a media stake (photo, video or voice note) to a chat with the given caption."""
+    method = MEDIA_SEND_METHODS.get(stake['type'])
+    if method is None:
+        logger.error(f"Unknown stake type '{stake['type']}', cannot send it to chat {chat_id}")
+        return
+    await getattr(bot, method)(chat_id, stake['value'], caption=caption, parse_mode='HTML')
+
+
+# Cell emoji indexed by cell value (empty, player 1, player 2)
+_C4_EMOJI = ('⚫️', '🔴', '🟡')
+
+@lru_cache(maxsize=1024)
+def _c4_keyboard(game_id: str) -> InlineKeyboardMarkup:
+    """The column keyboard for a game; markups are immutable, so one is shared for the whole game."""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(str(i + 1), callback_data=f'c4_move_{game_id}_{i}') for i in range(7)]
+    ])
+
 def create_connect_four_board_markup(board: list, game_id: str):
     """Creates the text and markup for a Connect Four board."""
-    emojis = {0: '⚫️', 1: '🔴', 2: '🟡'}
-    board_text = ""
-    for row in board:
-        board_text += " ".join([emojis.get(cell, '⚫️') for cell in row]) + "\n"
+    board_text = "".join(" ".join([_C4_EMOJI[cell] for cell in row]) + "\n" for row in board)
+    return board_text, _c4_keyboard(game_id)
+
+# Bitboard layout: each column takes 7 bits (6 rows plus an empty sentinel bit
+# on top), with bit 0 of a column being its bottom row.
+C4_COLUMN_BITS = 7
+C4_FULL_MASK = sum(((1 << 6) - 1) << (c * C4_COLUMN_BITS) for c in range(7))
+# Bit for every (row, col) cell, built once so lookups skip the index arithmetic
+C4_CELL_BITS = tuple(
+    tuple(1 << (c * C4_COLUMN_BITS + (5 - r)) for c in range(7)) for r in range(6)
+)
 
-    keyboard = [
-        [InlineKeyboardButton(str(i + 1), callback_data=f'c4_move_{game_id}_{i}') for i in range(7)]
-    ]
-    return board_text, InlineKeyboardMarkup(keyboard)
-
-
-def check_connect_four_win(board: list, player_num: int) -> bool:
-    """Check for a win in Connect Four."""
-    # Check horizontal
-    for r in range(6):
-        for c in range(4):
-            if all(board[r][c + i] == player_num for i in range(4)):
-                return True
-    # Check vertical
-    for r in range(3):
-        for c in range(7):
-            if all(board[r + i][c] == player_num for i in range(4)):
-                return True
-    # Check diagonal (down-right)
-    for r in range(3):
-        for c in range(4):
-            if all(board[r + i][c + i] == player_num for i in range(4)):
-                return True
-    # Check diagonal (up-right)
-    for r in range(3, 6):
-        for c in range(4):
-            if all(board[r - i][c + i] == player_num for i in range(4)):
-                return True
+def _c4_lines_through():
+    """Build, for each cell, the bitmasks of every four-in-a-row line that contains it."""
+    through = [[[] for _ in range(7)] for _ in range(6)]
+    for dr, dc in ((0, 1), (1, 0), (1, 1), (-1, 1)):
+        for r in range(6):
+            for c in range(7):
+                cells = [(r + i * dr, c + i * dc) for i in range(4)]
+                if not all(0 <= lr < 6 and 0 <= lc < 7 for lr, lc in cells):
+                    continue
+                mask = sum(C4_CELL_BITS[lr][lc] for lr, lc in cells)
+                for lr, lc in cells:
+                    through[lr][lc].append(mask)
+    return tuple(tuple(tuple(masks) for masks in row) for row in through)
+
+# C4_LINES_THROUGH[r][c]: masks of the (at most 13) winning lines through that cell
+C4_LINES_THROUGH = _c4_lines_through()
+
+def c4_bit(row: int, col: int) -> int:
+    """Return the bitboard bit for a board cell (row 0 is the top row)."""
+    return C4_CELL_BITS[row][col]
+
+def board_to_bitboards(board: list) -> tuple:
+    """Convert a Connect Four board to (p1_bits, p2_bits) bitboards."""
+    bits = [0, 0, 0]
+    for row, row_bits in zip(board, C4_CELL_BITS):
+        for cell, bit in zip(row, row_bits):
+            if cell:
+                bits[cell] |= bit
+    return bits[1], bits[2]
+
+def c4_column_height(bitboards: list, col: int) -> int:
+    """Number of pieces in a column; pieces stack from bit 0, so this is the filled bits' length."""
+    return (((bitboards[0] | bitboards[1]) >> (col * C4_COLUMN_BITS)) & 0x3F).bit_length()
+
+def check_connect_four_win_at(bits: int, row: int, col: int) -> bool:
+    """Check whether the piece just placed at (row, col) completed a line for bits."""
+    for mask in C4_LINES_THROUGH[row][col]:
+        if bits & mask == mask:
+            return True
     return False
 
-
-def check_connect_four_draw(board: list) -> bool:
-    """Check for a draw in Connect Four."""
-    return all(cell != 0 for cell in board[0])
+def get_c4_bitboards(game: dict) -> list:
+    """Return the game's cached [p1_bits, p2_bits], building it from the board if missing."""
+    if 'bitboards' not in game:
+        game['bitboards'] = list(board_to_bitboards(game['board']))
+    return game['bitboards']
 
 
 async def handle_game_over(context: ContextTypes.DEFAULT_TYPE, game_id: str, winner_id: int, loser_id: int):
@@ -575,35 +943,24 @@ async def handle_game_over(context: ContextTypes.DEFAULT_TYPE, game_id: str, win
         logger.error(f"No loser stake found for game {game_id}")
         return
 
-    loser_member = await context.bot.get_chat_member(game['group_id'], loser_id)
-    winner_member = await context.bot.get_chat_member(game['group_id'], winner_id)
-    loser_name = get_display_name(loser_id, loser_member.user.full_name)
-    winner_name = get_display_name(winner_id, winner_member.user.full_name)
+    loser_name = await get_game_player_name(context, game, loser_id)
+    winner_name = await get_game_player_name(context, game, winner_id)
+    winner_subject = player_subject(game, winner_id, winner_name)
 
     if loser_stake['type'] == 'points':
         points_val = loser_stake['value']
         await add_user_points(game['group_id'], winner_id, points_val, context)
         await add_user_points(game['group_id'], loser_id, -points_val, context)
-        message = f"{winner_name.capitalize()} has won the game! {loser_name} lost {points_val} points."
-        if 'fag' in winner_name:
-            message = f"The {winner_name} has won the game! {loser_name} lost {points_val} points."
         await context.bot.send_message(
             game['group_id'],
-            message,
+            f"{winner_subject} has won the game! {loser_name} lost {points_val} points.",
             parse_mode='HTML'
         )
     else:  # media
-        caption = f"{winner_name.capitalize()} won the game! This is the loser's stake from {loser_name}."
-        if 'fag' in winner_name:
-            caption = f"The {winner_name} won the game! This is the loser's stake from {loser_name}."
-        if loser_stake['type'] == 'photo':
-            await context.bot.send_photo(game['group_id'], loser_stake['value'], caption=caption, parse_mode='HTML')
-        elif loser_stake['type'] == 'video':
-            await context.bot.send_video(game['group_id'], loser_stake['value'], caption=caption, parse_mode='HTML')
-        elif loser_stake['type'] == 'voice':
-            await context.bot.send_voice(game['group_id'], loser_stake['value'], caption=caption, parse_mode='HTML')
+        caption = f"{winner_subject} won the game! This is the loser's stake from {loser_name}."
+        await send_stake_media(context.bot, game['group_id'], loser_stake, caption)
 
-    game['status'] = 'complete'
+    mark_game_complete(game)
     save_games_data(games_data)
 
 
@@ -612,8 +969,8 @@ async def connect_four_move_handler(update: Update, context: ContextTypes.DEFAUL
     query = update.callback_query
     await query.answer()
 
-    _, _, game_id, col_str = query.data.split('_')
-    col = int(col_str)
+    game_id = context.match['game_id']
+    col = int(context.match['col'])
     user_id = query.from_user.id
 
     games_data = load_games_data()
@@ -630,35 +987,30 @@ async def connect_four_move_handler(update: Update, context: ContextTypes.DEFAUL
 
     # Make the move
     board = game['board']
+    bitboards = get_c4_bitboards(game)
     player_num = 1 if user_id == game['challenger_id'] else 2
 
-    # Find the lowest empty row in the column
-    move_made = False
-    for r in range(5, -1, -1):
-        if board[r][col] == 0:
-            board[r][col] = player_num
-            move_made = True
-            break
-
-    if not move_made:
+    # The lowest empty row sits just above the column's height
+    height = c4_column_height(bitboards, col)
+    if height >= 6:
         await query.answer("This column is full!", show_alert=True)
         return
+    move_row = 5 - height
+    board[move_row][col] = player_num
+    bitboards[player_num - 1] |= c4_bit(move_row, col)
 
     game['board'] = board
 
-    # Check for win
-    if check_connect_four_win(board, player_num):
+    # Check for win; only lines through the new piece can have been completed
+    if check_connect_four_win_at(bitboards[player_num - 1], move_row, col):
         winner_id = user_id
-        loser_id = game['opponent_id'] if user_id == game['challenger_id'] else game['challenger_id']
+        loser_id = get_opponent_id(game, user_id)
 
-        winner_member = await context.bot.get_chat_member(game['group_id'], winner_id)
-        winner_name = get_display_name(winner_id, winner_member.user.full_name)
+        winner_name = await get_game_player_name(context, game, winner_id)
 
         board_text, _ = create_connect_four_board_markup(board, game_id)
 
-        win_message = f"{winner_name.capitalize()} wins!"
-        if 'fag' in winner_name:
-            win_message = f"The {winner_name} wins!"
+        win_message = f"{player_subject(game, winner_id, winner_name)} wins!"
 
         await query.edit_message_text(
             f"<b>Connect Four - Game Over!</b>\n\n{board_text}\n{win_message}",
@@ -668,20 +1020,20 @@ async def connect_four_move_handler(update: Update, context: ContextTypes.DEFAUL
         return
 
     # Check for draw
-    if check_connect_four_draw(board):
+    if (bitboards[0] | bitboards[1]) == C4_FULL_MASK:
         board_text, _ = create_connect_four_board_markup(board, game_id)
         await query.edit_message_text(f"<b>Connect Four - Draw!</b>\n\n{board_text}\nThe game is a draw!")
-        game['status'] = 'complete'
+        mark_game_complete(game)
         save_games_data(games_data)
         return
 
     # Switch turns
-    game['turn'] = game['opponent_id'] if user_id == game['challenger_id'] else game['challenger_id']
+    game['turn'] = get_opponent_id(game, user_id)
     save_games_data(games_data)
 
     # Update board message
     turn_player_id = game['turn']
-    turn_player_member = await context.bot.get_chat_member(game['group_id'], turn_player_id)
+    turn_player_member = await cached_get_chat_member(context.bot, game['group_id'], turn_player_id)
     turn_player_name = get_display_name(turn_player_id, turn_player_member.user.full_name)
     board_text, reply_markup = create_connect_four_board_markup(game['board'], game_id)
 
@@ -701,31 +1053,21 @@ BATTLESHIP_SHIPS = {
 }
 BS_AWAITING_PLACEMENT = 0
 
-def parse_bs_coords(coord_str: str) -> tuple[int, int] | None:
-    """Parses 'A1' style coordinates into (row, col) tuple."""
-    coord_str = coord_str.upper().strip()
-    if not (2 <= len(coord_str) <= 3): return None
-    col_char = coord_str[0]
-    row_str = coord_str[1:]
-    if not ('A' <= col_char <= 'J' and row_str.isdigit()): return None
-    row = int(row_str) - 1
-    col = ord(col_char) - ord('A')
-    if not (0 <= row <= 9 and 0 <= col <= 9): return None
-    return row, col
+# Ship placement input such as 'A1 H' or 'b10 v': column, row and orientation
+BS_PLACEMENT_RE = re.compile(r'^\s*([A-J])(10|[1-9])\s+([HV])\s*$', re.IGNORECASE)
+
+# Cell emoji indexed by cell value (water, ship, miss, hit), with and without ships revealed
+_BS_SHOWN = ('🟦', '🚢', '❌', '🔥')
+_BS_HIDDEN = ('🟦', '🟦', '❌', '🔥')
 
 def generate_bs_board_text(board: list, show_ships: bool = True) -> str:
     """Generates a text representation of a battleship board."""
-    emojis = {'water': '🟦', 'ship': '🚢', 'hit': '🔥', 'miss': '❌'}
-
-    map_values = {0: emojis['water'], 1: emojis['ship'] if show_ships else emojis['water'], 2: emojis['miss'], 3: emojis['hit']}
-
+    emojis = _BS_SHOWN if show_ships else _BS_HIDDEN
     header = '`  A B C D E F G H I J`\n'
-    board_text = header
-    for r, row_data in enumerate(board):
-        row_num = str(r + 1).rjust(2)
-        row_str = ' '.join([map_values.get(cell, '🟦') for cell in row_data])
-        board_text += f"`{row_num} {row_str}`\n"
-    return board_text
+    return header + "".join(
+        f"`{str(r + 1).rjust(2)} {' '.join([emojis[cell] for cell in row_data])}`\n"
+        for r, row_data in enumerate(board)
+    )
 
 async def bs_start_game_in_group(context: ContextTypes.DEFAULT_TYPE, game_id: str):
     """Announces the start of the Battleship game in the group chat and prompts the first player."""
@@ -733,7 +1075,7 @@ async def bs_start_game_in_group(context: ContextTypes.DEFAULT_TYPE, game_id: st
     game = games_data[game_id]
 
     challenger_id = game['challenger_id']
-    challenger_member = await context.bot.get_chat_member(game['group_id'], challenger_id)
+    challenger_member = await cached_get_chat_member(context.bot, game['group_id'], challenger_id)
     challenger_name = get_display_name(challenger_id, challenger_member.user.full_name)
 
     await context.bot.send_message(
@@ -743,61 +1085,82 @@ async def bs_start_game_in_group(context: ContextTypes.DEFAULT_TYPE, game_id: st
     )
     await bs_send_turn_message(context, game_id)
 
-def check_bs_ship_sunk(board: list, ship_coords: list) -> bool:
+def bs_ship_cells(ship_coords: list) -> list:
+    """Returns a ship's cells as flat r * 10 + c indices, converting games saved with [r, c] pairs."""
+    return [cell if isinstance(cell, int) else cell[0] * 10 + cell[1] for cell in ship_coords]
+
+def bs_ship_at(game: dict, player_id_str: str, cell: int):
+    """Returns the name of the player's ship covering cell, or None for water."""
+    ship_at = game.setdefault('ship_at', {}).get(player_id_str)
+    if ship_at is None:
+        # Built on the first attack and saved with the game; JSON keys must be strings
+        ship_at = {
+            str(ship_cell): ship
+            for ship, coords in game['ships'][player_id_str].items()
+            for ship_cell in bs_ship_cells(coords)
+        }
+        game['ship_at'][player_id_str] = ship_at
+    return ship_at.get(str(cell))
+
+def check_bs_ship_sunk(board: list, ship_cells: list) -> bool:
     """Checks if a ship has been completely sunk."""
-    return all(board[r][c] == 3 for r, c in ship_coords)
+    return all(board[cell // 10][cell % 10] == 3 for cell in ship_cells)
+
+def check_bs_all_sunk(board: list) -> bool:
+    """Checks if every ship on a board has been sunk (no unhit ship cells left)."""
+    return not any(1 in row for row in board)
+
+def bs_attack_keyboard(game_id: str, target_board: list) -> InlineKeyboardMarkup:
+    """
+    One button per square of the opponent's board, so an attack is a single tap.
+    Each board row is split into two keyboard rows of 5 (A-E, F-J) to stay within
+    Telegram's limit of 8 buttons per row.
+    """
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton(
+                f"{chr(ord('A') + c)}{r + 1}" if row[c] < 2 else _BS_HIDDEN[row[c]],
+                callback_data=f"bs_attack_{game_id}_{r}_{c}"
+            )
+            for c in range(half, half + 5)
+        ]
+        for r, row in enumerate(target_board)
+        for half in (0, 5)
+    ])
 
 async def bs_send_turn_message(context: ContextTypes.DEFAULT_TYPE, game_id: str, message_id: int = None, chat_id: int = None):
     """Sends the private message to the current player to make their move."""
     games_data = load_games_data()
     game = games_data[game_id]
 
-    player_id_str = str(game['turn'])
-    opponent_id_str = str(game['opponent_id'] if player_id_str == str(game['challenger_id']) else game['challenger_id'])
+    player_id = game['turn']
+    player_id_str, opponent_id_str = str(player_id), str(get_opponent_id(game, player_id))
 
     my_board_text = generate_bs_board_text(game['boards'][player_id_str], show_ships=True)
     tracking_board_text = generate_bs_board_text(game['boards'][opponent_id_str], show_ships=False)
 
-    # Keyboard to select a column to attack
-    keyboard = [
-        [InlineKeyboardButton(chr(ord('A') + c), callback_data=f"bs_col_{game_id}_{c}") for c in range(5)],
-        [InlineKeyboardButton(chr(ord('A') + c), callback_data=f"bs_col_{game_id}_{c}") for c in range(5, 10)]
-    ]
-
-    text = f"YOUR BOARD:\n{my_board_text}\nOPPONENT'S BOARD:\n{tracking_board_text}\nSelect a column to attack:"
+    text = f"YOUR BOARD:\n{my_board_text}\nOPPONENT'S BOARD:\n{tracking_board_text}\nSelect a square to attack:"
+    reply_markup = bs_attack_keyboard(game_id, game['boards'][opponent_id_str])
 
     if message_id and chat_id:
         await context.bot.edit_message_text(
             chat_id=chat_id, message_id=message_id, text=text,
-            reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='MarkdownV2'
+            reply_markup=reply_markup, parse_mode='MarkdownV2'
         )
     else:
         await context.bot.send_message(
             chat_id=int(player_id_str), text=text,
-            reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='MarkdownV2'
+            reply_markup=reply_markup, parse_mode='MarkdownV2'
         )
 
-async def bs_select_col_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handles the player selecting a column, then asks for the row."""
-    query = update.callback_query
-    await query.answer()
-
-    _, _, game_id, c_str = query.data.split('_')
-    c = int(c_str)
-
-    # Keyboard to select a row to attack
-    keyboard = [[InlineKeyboardButton(str(r + 1), callback_data=f"bs_attack_{game_id}_{r}_{c}") for r in range(10)]]
-
-    await query.edit_message_reply_markup(reply_markup=InlineKeyboardMarkup(keyboard))
-
 async def bs_attack_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles the player's final attack choice."""
     query = update.callback_query
     await query.answer()
 
-    _, _, game_id, r_str, c_str = query.data.split('_')
-    r, c = int(r_str), int(c_str)
-    user_id_str = str(query.from_user.id)
+    game_id = context.match['game_id']
+    r, c = int(context.match['row']), int(context.match['col'])
+    user_id = query.from_user.id
 
     games_data = load_games_data()
     game = games_data.get(game_id)
@@ -806,11 +1169,12 @@ async def bs_attack_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("This game is no longer active.")
         return
 
-    if str(game.get('turn')) != user_id_str:
+    if game.get('turn') != user_id:
         await query.answer("It's not your turn!", show_alert=True)
         return
 
-    opponent_id_str = str(game['opponent_id'] if user_id_str == str(game['challenger_id']) else game['challenger_id'])
+    opponent_id = get_opponent_id(game, user_id)
+    opponent_id_str = str(opponent_id)
     opponent_board = game['boards'][opponent_id_str]
     target_val = opponent_board[r][c]
 
@@ -823,59 +1187,66 @@ async def bs_attack_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         opponent_board[r][c] = 2; result_text = "It's a MISS!"
     elif target_val == 1:
         opponent_board[r][c] = 3; result_text = "It's a HIT!"
-        for ship, coords in game['ships'][opponent_id_str].items():
-            if (r, c) in coords and check_bs_ship_sunk(opponent_board, coords):
-                result_text += f"\nYou sunk their {ship}!"
-                break
+        ship = bs_ship_at(game, opponent_id_str, r * 10 + c)
+        if ship and check_bs_ship_sunk(opponent_board, bs_ship_cells(game['ships'][opponent_id_str][ship])):
+            result_text += f"\nYou sunk their {ship}!"
 
-    all_sunk = all(check_bs_ship_sunk(opponent_board, coords) for coords in game['ships'][opponent_id_str].values())
+    all_sunk = target_val == 1 and check_bs_all_sunk(opponent_board)
 
     if all_sunk:
-        winner_name = get_display_name(int(user_id_str), query.from_user.full_name)
-        win_message = f"The game is over! {winner_name.capitalize()} has won the battle!"
-        if 'fag' in winner_name:
-            win_message = f"The game is over! The {winner_name} has won the battle!"
+        winner_name = await get_game_player_name(context, game, user_id)
+        win_message = f"The game is over! {player_subject(game, user_id, winner_name)} has won the battle!"
         await context.bot.send_message(
             chat_id=game['group_id'],
             text=win_message,
             parse_mode='HTML'
         )
-        await handle_game_over(context, game_id, int(user_id_str), int(opponent_id_str))
+        await handle_game_over(context, game_id, user_id, opponent_id)
         await query.edit_message_text("You are victorious! See the group for the result.")
         return
 
-    game['turn'] = int(opponent_id_str)
+    game['turn'] = opponent_id
     save_games_data(games_data)
 
-    opponent_member = await context.bot.get_chat_member(game['group_id'], int(opponent_id_str))
-    opponent_name = get_display_name(int(opponent_id_str), opponent_member.user.full_name)
-    attacker_name = get_display_name(int(user_id_str), query.from_user.full_name)
+    opponent_member = await cached_get_chat_member(context.bot, game['group_id'], opponent_id)
+    opponent_name = get_display_name(opponent_id, opponent_member.user.full_name)
+    attacker_name = get_display_name(user_id, query.from_user.full_name)
     coord_name = f"{chr(ord('A')+c)}{r+1}"
 
     await query.edit_message_text(f"You fired at {coord_name}. {result_text}\n\nWaiting for {opponent_name} to move.", parse_mode='HTML')
 
     try:
         await context.bot.send_message(
-            chat_id=int(opponent_id_str),
+            chat_id=opponent_id,
             text=f"{attacker_name} fired at {coord_name}. {result_text}"
         )
     except Exception as e:
         print(f"Failed to send attack result to victim: {e}")
 
-    await context.bot.send_message(
-        chat_id=game['group_id'],
-        text=f"It is now {opponent_name}'s turn.",
-        parse_mode='HTML'
-    )
-
     await bs_send_turn_message(context, game_id)
 
+async def bs_legacy_col_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Column buttons from the old two-step attack picker: swap them for the one-tap keyboard."""
+    query = update.callback_query
+    await query.answer()
+
+    game_id = context.match['game_id']
+    game = load_games_data().get(game_id)
+    if not game or game.get('status') != 'active':
+        await query.edit_message_text("This game is no longer active.")
+        return
+    if game.get('turn') != query.from_user.id:
+        await query.answer("It's not your turn!", show_alert=True)
+        return
+
+    await bs_send_turn_message(context, game_id, query.message.message_id, query.message.chat_id)
+
 async def bs_start_placement(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Entry point for the battleship ship placement conversation."""
     query = update.callback_query
     await query.answer()
 
-    _, _, game_id = query.data.split('_')
+    game_id = context.match['game_id']
     user_id = str(query.from_user.id)
 
     games_data = load_games_data()
@@ -884,6 +1255,11 @@ async def bs_start_placement(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await query.edit_message_text("This game no longer exists.")
         return ConversationHandler.END
 
+    # Completed games drop their boards, and a game can be ended with /loser during placement
+    if game.get('status') != 'active':
+        await query.edit_message_text("This game is no longer active.")
+        return ConversationHandler.END
+
     if game.get('placement_complete', {}).get(user_id):
         await query.edit_message_text("You have already placed your ships.")
         return ConversationHandler.END
@@ -911,64 +1287,65 @@ async def bs_handle_placement(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     user_id = str(update.effective_user.id)
     games_data = load_games_data()
-    game = games_data[game_id]
+    game = games_data.get(game_id)
+    if not game or game.get('status') != 'active':
+        context.user_data.pop('bs_game_id', None)
+        context.user_data.pop('bs_ships_to_place', None)
+        await update.message.reply_text("This game is no longer active.")
+        return ConversationHandler.END
     board = game['boards'][user_id]
 
     ship_name = context.user_data['bs_ships_to_place'][0]
     ship_size = BATTLESHIP_SHIPS[ship_name]
 
-    text = update.message.text.strip().upper()
-    parts = text.split()
-
-    if len(parts) != 2:
-        await update.message.reply_text("Invalid format. Please use `A1 H` or `A1 V`.", parse_mode='MarkdownV2')
-        return BS_AWAITING_PLACEMENT
-
-    start_coord_str, orientation = parts
-    start_pos = parse_bs_coords(start_coord_str)
-
-    if not start_pos or orientation not in ['H', 'V']:
+    match = BS_PLACEMENT_RE.match(update.message.text)
+    if not match:
         await update.message.reply_text("Invalid coordinate or orientation. Use `A1 H` or `B2 V`.", parse_mode='MarkdownV2')
         return BS_AWAITING_PLACEMENT
 
-    r_start, c_start = start_pos
-    ship_coords = []
-
-    valid = True
-    for i in range(ship_size):
-        r, c = r_start, c_start
-        if orientation == 'H': c += i
-        else: r += i
+    col_char, row_str, orientation = match.groups()
+    r_start, c_start = int(row_str) - 1, ord(col_char.upper()) - ord('A')
+    orientation = orientation.upper()
 
-        if not (0 <= r <= 9 and 0 <= c <= 9): valid = False; break
-        if board[r][c] != 0: valid = False; break
-        ship_coords.append((r, c))
+    # Flat r * 10 + c cell indices; they survive the JSON round trip unchanged, unlike (r, c) tuples
+    start = r_start * 10 + c_start
+    if orientation == 'H':
+        end = c_start + ship_size
+        valid = end <= 10 and not any(board[r_start][c_start:end])
+        ship_cells = list(range(start, start + ship_size))
+    else:
+        end = r_start + ship_size
+        valid = end <= 10 and not any(board[r][c_start] for r in range(r_start, end))
+        ship_cells = list(range(start, start + ship_size * 10, 10))
 
     if not valid:
         await update.message.reply_text("Invalid placement: ship is out of bounds or overlaps another ship. Try again.")
         return BS_AWAITING_PLACEMENT
 
-    for r, c in ship_coords:
-        board[r][c] = 1
-    game['ships'][user_id][ship_name] = ship_coords
+    if orientation == 'H':
+        board[r_start][c_start:end] = [1] * ship_size
+    else:
+        for r in range(r_start, end):
+            board[r][c_start] = 1
+    game['ships'][user_id][ship_name] = ship_cells
 
     context.user_data['bs_ships_to_place'].pop(0)
 
-    save_games_data(games_data)
     board_text = generate_bs_board_text(board)
 
     if not context.user_data['bs_ships_to_place']:
+        # One write covers the last ship and the completed placement
         game['placement_complete'][user_id] = True
         save_games_data(games_data)
-
         await update.message.reply_text(f"Final board:\n{board_text}\nAll ships placed! Waiting for opponent...", parse_mode='MarkdownV2')
 
-        opponent_id = str(game['opponent_id'] if user_id == str(game['challenger_id']) else game['challenger_id'])
+        opponent_id = str(get_opponent_id(game, update.effective_user.id))
         if game.get('placement_complete', {}).get(opponent_id):
             await bs_start_game_in_group(context, game_id)
 
         return ConversationHandler.END
     else:
+        save_games_data(games_data)
         next_ship_name = context.user_data['bs_ships_to_place'][0]
         next_ship_size = BATTLESHIP_SHIPS[next_ship_name]
         await update.message.reply_text(
@@ -986,8 +1363,7 @@ async def bs_placement_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE
         if game_id in games_data:
             game = games_data[game_id]
             # Notify the other player if possible
-            user_id = str(update.effective_user.id)
-            other_player_id = str(game['opponent_id'] if user_id == str(game['challenger_id']) else game['challenger_id'])
+            other_player_id = get_opponent_id(game, update.effective_user.id)
             try:
                 await context.bot.send_message(
                     chat_id=other_player_id,
@@ -1009,26 +1385,38 @@ async def bs_placement_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE
 # =============================
 PUNISHMENTS_DATA_FILE = 'punishments.json'
 PUNISHMENT_STATUS_FILE = 'punishment_status.json'
+_COMPACT_JSON_FILES.add(PUNISHMENT_STATUS_FILE)
+
+def _by_threshold(punishments):
+    """Returns the punishments keyed by lowercase message, highest threshold first."""
+    return {p["message"].lower(): p for p in sorted(punishments, key=lambda p: p["threshold"], reverse=True)}
+
+def _migrate_punishments(data):
+    """One-shot migration from the old per-group list of punishments to a dict keyed by lowercase message."""
+    legacy_groups = [group_id for group_id, punishments in data.items() if isinstance(punishments, list)]
+    if legacy_groups:
+        for group_id in legacy_groups:
+            data[group_id] = _by_threshold(data[group_id])
+        save_punishments_data(data)
+        logger.info(f"Migrated punishments for groups {legacy_groups} to the keyed format")
+    return data
 
 def load_punishments_data():
-    if os.path.exists(PUNISHMENTS_DATA_FILE):
-        with open(PUNISHMENTS_DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    return _migrate_punishments(_cached_load(PUNISHMENTS_DATA_FILE))
 
 def save_punishments_data(data):
-    with open(PUNISHMENTS_DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # Admin commands can change it several times in a row, so batch the writes
+    _mark_dirty(PUNISHMENTS_DATA_FILE, data)
+
+async def aload_punishments_data():
+    return _migrate_punishments(await _aload_json(PUNISHMENTS_DATA_FILE))
 
 def load_punishment_status_data():
-    if os.path.exists(PUNISHMENT_STATUS_FILE):
-        with open(PUNISHMENT_STATUS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    return _cached_load(PUNISHMENT_STATUS_FILE)
 
 def save_punishment_status_data(data):
-    with open(PUNISHMENT_STATUS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # Written from check_for_punishment on point changes, so batch the writes
+    _mark_dirty(PUNISHMENT_STATUS_FILE, data)
 
 def get_triggered_punishments_for_user(group_id, user_id) -> list:
     data = load_punishment_status_data()
@@ -1076,286 +1464,281 @@ async def reward_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     /reward: Show reward list, ask user to choose, handle purchase or 'Other'.
     """
     group_id = str(update.effective_chat.id)
-    rewards = get_rewards_list(group_id)
-    msg = "<b>Available Rewards:</b>\n"
-    for r in rewards:
-        msg += f"• <b>{r['name']}</b> — {r['cost']} points\n"
+    msg = "<b>Available Rewards:</b>\n" + get_rewards_view(group_id).priced_html
     msg += "\nReply with the name of the reward you want to buy, or type /cancel to abort."
-    context.user_data[REWARD_STATE] = {'group_id': group_id}
+    set_conversation_step(context, REWARD_STATE, {'group_id': group_id})
     await update.message.reply_text(msg, parse_mode='HTML')
 
-async def conversation_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """
-    Handles all conversation-based interactions after a command has been issued.
-    This acts as a router based on the state stored in context.user_data.
-    """
-    # Update user activity to prevent being kicked for inactivity during a conversation
-    if update.effective_user and update.effective_chat and update.effective_chat.type in ["group", "supergroup"]:
-        update_user_activity(update.effective_user.id, update.effective_chat.id)
+def parse_int(text: str):
+    """Parses a whole number (optionally signed) from user input, returning None instead of raising."""
+    text = text.strip()
+    digits = text[1:] if text.startswith(('-', '+')) else text
+    # isdecimal (not isdigit) accepts exactly the digits int() does
+    if not digits.isdecimal():
+        return None
+    return int(text)
+
+async def handle_addreward_cost(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Add reward flow, step 2: the reply is the new reward's cost."""
+    state = context.user_data[ADDREWARD_COST_STATE]
+    cost = parse_int(update.message.text)
+    if cost is None or cost < 0:
+        await update.message.reply_text("Please reply with a valid positive integer for the cost.")
+        return
+    group_id = state['group_id']
+    name = state['name']
+    if add_reward(group_id, name, cost):
+        await update.message.reply_text(f"Reward '{name}' added with cost {cost} points.")
+    else:
+        await update.message.reply_text(f"Could not add reward '{name}'. It may already exist or is not allowed.")
+    context.user_data.pop(ADDREWARD_COST_STATE, None)
 
-    # === Add Reward Flow: Step 2 (Cost) ===
-    if ADDREWARD_COST_STATE in context.user_data:
-        state = context.user_data[ADDREWARD_COST_STATE]
-        try:
-            cost = int(update.message.text.strip())
-            if cost < 0:
-                raise ValueError
-        except ValueError:
-            await update.message.reply_text("Please reply with a valid positive integer for the cost.")
-            return
-        group_id = state['group_id']
-        name = state['name']
-        if add_reward(group_id, name, cost):
-            await update.message.reply_text(f"Reward '{name}' added with cost {cost} points.")
-        else:
-            await update.message.reply_text(f"Could not add reward '{name}'. It may already exist or is not allowed.")
-        context.user_data.pop(ADDREWARD_COST_STATE, None)
-        return
 
-    # === Add Reward Flow: Step 1 (Name) ===
-    if ADDREWARD_STATE in context.user_data:
-        state = context.user_data[ADDREWARD_STATE]
-        name = update.message.text.strip()
-        if name.lower() == "other":
-            await update.message.reply_text("You cannot add the reward 'Other'.")
-            context.user_data.pop(ADDREWARD_STATE, None)
-            return
-        state['name'] = name
-        context.user_data[ADDREWARD_COST_STATE] = state
+async def handle_addreward_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Add reward flow, step 1: the reply is the new reward's name."""
+    state = context.user_data[ADDREWARD_STATE]
+    name = update.message.text.strip()
+    if name.lower() == "other":
+        await update.message.reply_text("You cannot add the reward 'Other'.")
         context.user_data.pop(ADDREWARD_STATE, None)
-        await update.message.reply_text(f"What is the cost (in points) for the reward '{name}'?")
         return
+    state['name'] = name
+    set_conversation_step(context, ADDREWARD_COST_STATE, state)
+    context.user_data.pop(ADDREWARD_STATE, None)
+    await update.message.reply_text(f"What is the cost (in points) for the reward '{name}'?")
 
-    # === Remove Reward Flow ===
-    if REMOVEREWARD_STATE in context.user_data:
-        state = context.user_data[REMOVEREWARD_STATE]
-        name = update.message.text.strip()
-        if name.lower() == "other":
-            await update.message.reply_text("You cannot remove the reward 'Other'.")
-            context.user_data.pop(REMOVEREWARD_STATE, None)
-            return
-        group_id = state['group_id']
-        if remove_reward(group_id, name):
-            await update.message.reply_text(f"Reward '{name}' removed.")
-        else:
-            await update.message.reply_text(f"Could not remove reward '{name}'. It may not exist or is not allowed.")
+
+async def handle_removereward_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Remove reward flow: the reply is the name of the reward to remove."""
+    state = context.user_data[REMOVEREWARD_STATE]
+    name = update.message.text.strip()
+    if name.lower() == "other":
+        await update.message.reply_text("You cannot remove the reward 'Other'.")
         context.user_data.pop(REMOVEREWARD_STATE, None)
         return
+    group_id = state['group_id']
+    if remove_reward(group_id, name):
+        await update.message.reply_text(f"Reward '{name}' removed.")
+    else:
+        await update.message.reply_text(f"Could not remove reward '{name}'. It may not exist or is not allowed.")
+    context.user_data.pop(REMOVEREWARD_STATE, None)
 
-    # === User Reward Choice Flow ===
-    if REWARD_STATE in context.user_data:
-        state = context.user_data[REWARD_STATE]
-        group_id = state['group_id']
-        user_id = update.effective_user.id
-        choice = update.message.text.strip()
-        rewards = get_rewards_list(group_id)
-        reward = next((r for r in rewards if r['name'].lower() == choice.lower()), None)
-        if not reward:
-            await update.message.reply_text("That reward does not exist. Please reply with a valid reward name or type /cancel.")
-            return
-        if reward['name'].lower() == 'other':
-            display_name = get_display_name(user_id, update.effective_user.full_name)
-            chat_title = update.effective_chat.title
-
-            message = f"You have selected 'Other', {display_name}. Please contact Beta or Lion to determine your reward and its cost."
-            await update.message.reply_text(message, parse_mode='HTML')
-
-            admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-            for admin in admins:
-                try:
-                    admin_message = f"The user {display_name} has selected the 'Other' reward in group {chat_title}. They will contact you to finalize the details."
-                    if 'fag' in display_name:
-                        admin_message = f"The fag has selected the 'Other' reward in group {chat_title}. They will contact you to finalize the details."
-                    await context.bot.send_message(
-                        chat_id=admin.user.id,
-                        text=admin_message,
-                        parse_mode='HTML'
-                    )
-                except Exception:
-                    pass
-            context.user_data.pop(REWARD_STATE, None)
-            return
-        user_points = get_user_points(group_id, user_id)
-        if user_points < reward['cost']:
-            await update.message.reply_text(f"You do not have enough points for this reward. You have {user_points}, but it costs {reward['cost']}.")
-            context.user_data.pop(REWARD_STATE, None)
-            return
-        await add_user_points(group_id, user_id, -reward['cost'], context)
 
-        # Public announcement
+async def handle_reward_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Reward purchase flow: the reply is the chosen reward."""
+    state = context.user_data[REWARD_STATE]
+    group_id = state['group_id']
+    user_id = update.effective_user.id
+    choice = update.message.text.strip()
+    reward = get_reward(group_id, choice)
+    if not reward:
+        await update.message.reply_text("That reward does not exist. Please reply with a valid reward name or type /cancel.")
+        return
+    if reward['name'].lower() == 'other':
         display_name = get_display_name(user_id, update.effective_user.full_name)
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text=f"🎁 <b>{display_name}</b> just bought the reward: <b>{reward['name']}</b>! 🎉",
-            parse_mode='HTML'
-        )
+        chat_title = update.effective_chat.title
 
-        # Private message to admins
-        admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-        for admin in admins:
-            try:
-                await context.bot.send_message(
-                    chat_id=admin.user.id,
-                    text=f"User {display_name} (ID: {user_id}) in group {update.effective_chat.title} (ID: {group_id}) just bought the reward: '{reward['name']}' for {reward['cost']} points."
-                )
-            except Exception:
-                logger.warning(f"Failed to notify admin {admin.user.id} about reward purchase.")
+        message = f"You have selected 'Other', {display_name}. Please contact Beta or Lion to determine your reward and its cost."
+        await update.message.reply_text(message, parse_mode='HTML')
 
+        admin_message = f"The user {display_name} has selected the 'Other' reward in group {chat_title}. They will contact you to finalize the details."
+        if is_f_name(display_name):
+            admin_message = f"The fag has selected the 'Other' reward in group {chat_title}. They will contact you to finalize the details."
+        admins = await cached_get_admins(context.bot, update.effective_chat.id)
+        await notify_admins(context.bot, admins, admin_message, "'Other' reward", parse_mode='HTML')
         context.user_data.pop(REWARD_STATE, None)
         return
+    user_points = get_user_points(group_id, user_id)
+    if user_points < reward['cost']:
+        await update.message.reply_text(f"You do not have enough points for this reward. You have {user_points}, but it costs {reward['cost']}.")
+        context.user_data.pop(REWARD_STATE, None)
+        return
+    # The admin list doesn't depend on the points update, so fetch it alongside
+    deduction, admins = await asyncio.gather(
+        add_user_points(group_id, user_id, -reward['cost'], context),
+        cached_get_admins(context.bot, update.effective_chat.id),
+        return_exceptions=True
+    )
+    if isinstance(deduction, Exception):
+        raise deduction
+    if isinstance(admins, Exception):
+        # The points are already spent, so still announce the purchase
+        logger.warning(f"Failed to fetch admins of group {group_id} for a reward purchase: {admins}")
+        admins = []
+
+    # Public announcement
+    display_name = get_display_name(user_id, update.effective_user.full_name)
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text=f"🎁 <b>{display_name}</b> just bought the reward: <b>{reward['name']}</b>! 🎉",
+        parse_mode='HTML'
+    )
 
-    # === Add/Remove Points Flow ===
-    if ADDPOINTS_STATE in context.user_data:
-        state = context.user_data[ADDPOINTS_STATE]
-        try:
-            value = int(update.message.text.strip())
-        except ValueError:
-            await update.message.reply_text("Please reply with a valid integer number of points to add.")
-            return
-        await add_user_points(state['group_id'], state['target_id'], value, context)
-        await update.message.reply_text(f"Added {value} points.")
-        context.user_data.pop(ADDPOINTS_STATE, None)
+    # Private message to admins
+    await notify_admins(
+        context.bot, admins,
+        f"User {display_name} (ID: {user_id}) in group {update.effective_chat.title} (ID: {group_id}) just bought the reward: '{reward['name']}' for {reward['cost']} points.",
+        "reward purchase"
+    )
+
+    context.user_data.pop(REWARD_STATE, None)
+
+
+async def handle_addpoints_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Add points flow: the reply is the number of points to add."""
+    state = context.user_data[ADDPOINTS_STATE]
+    value = parse_int(update.message.text)
+    if value is None:
+        await update.message.reply_text("Please reply with a valid integer number of points to add.")
         return
+    await add_user_points(state['group_id'], state['target_id'], value, context)
+    await update.message.reply_text(f"Added {value} points.")
+    context.user_data.pop(ADDPOINTS_STATE, None)
 
-    if REMOVEPOINTS_STATE in context.user_data:
-        state = context.user_data[REMOVEPOINTS_STATE]
-        try:
-            value = int(update.message.text.strip())
-        except ValueError:
-            await update.message.reply_text("Please reply with a valid integer number of points to remove.")
-            return
-        await add_user_points(state['group_id'], state['target_id'], -value, context)
-        await update.message.reply_text(f"Removed {value} points.")
-        context.user_data.pop(REMOVEPOINTS_STATE, None)
-        return
-
-    # === Free Reward Flow ===
-    if FREE_REWARD_SELECTION in context.user_data:
-        state = context.user_data[FREE_REWARD_SELECTION]
-        group_id = state['group_id']
-        user_id = update.effective_user.id
-        choice = update.message.text.strip()
-        rewards = get_rewards_list(group_id)
-        reward = next((r for r in rewards if r['name'].lower() == choice.lower()), None)
-
-        if not reward:
-            await update.message.reply_text("That reward does not exist. Please reply with a valid reward name.")
-            return
 
-        display_name = get_display_name(user_id, update.effective_user.full_name)
-        await update.message.reply_text(f"Congratulations! You have claimed your free reward: <b>{reward['name']}</b>!", parse_mode='HTML')
+async def handle_removepoints_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Remove points flow: the reply is the number of points to remove."""
+    state = context.user_data[REMOVEPOINTS_STATE]
+    value = parse_int(update.message.text)
+    if value is None:
+        await update.message.reply_text("Please reply with a valid integer number of points to remove.")
+        return
+    await add_user_points(state['group_id'], state['target_id'], -value, context)
+    await update.message.reply_text(f"Removed {value} points.")
+    context.user_data.pop(REMOVEPOINTS_STATE, None)
 
-        admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-        for admin in admins:
-            try:
-                await context.bot.send_message(
-                    chat_id=admin.user.id,
-                    text=f"User {display_name} (ID: {user_id}) in group {update.effective_chat.title} (ID: {group_id}) claimed the free reward: '{reward['name']}'."
-                )
-            except Exception:
-                logger.warning(f"Failed to notify admin {admin.user.id} about free reward.")
 
-        context.user_data.pop(FREE_REWARD_SELECTION, None)
+async def handle_free_reward_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Free reward flow: the reply is the chosen reward."""
+    state = context.user_data[FREE_REWARD_SELECTION]
+    group_id = state['group_id']
+    user_id = update.effective_user.id
+    choice = update.message.text.strip()
+    reward = get_reward(group_id, choice)
+
+    if not reward:
+        await update.message.reply_text("That reward does not exist. Please reply with a valid reward name.")
         return
 
-    # === Ask Task Flow ===
-    if ASK_TASK_TARGET in context.user_data:
-        state = context.user_data[ASK_TASK_TARGET]
-        username = update.message.text.strip()
-        if not username.startswith('@'):
-            await update.message.reply_text("Please provide a valid @username.")
-            return
+    display_name = get_display_name(user_id, update.effective_user.full_name)
+    await update.message.reply_text(f"Congratulations! You have claimed your free reward: <b>{reward['name']}</b>!", parse_mode='HTML')
 
-        state['target_username'] = username
-        context.user_data[ASK_TASK_DESCRIPTION] = state
-        context.user_data.pop(ASK_TASK_TARGET, None)
-        await update.message.reply_text("What is the simple task you want to ask of them?")
+    admins = await cached_get_admins(context.bot, update.effective_chat.id)
+    await notify_admins(
+        context.bot, admins,
+        f"User {display_name} (ID: {user_id}) in group {update.effective_chat.title} (ID: {group_id}) claimed the free reward: '{reward['name']}'.",
+        "free reward"
+    )
+
+    context.user_data.pop(FREE_REWARD_SELECTION, None)
+
+
+async def handle_ask_task_target(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Ask task flow, step 1: the reply is the target's @username."""
+    state = context.user_data[ASK_TASK_TARGET]
+    username = update.message.text.strip()
+    if not username.startswith('@'):
+        await update.message.reply_text("Please provide a valid @username.")
         return
 
-    if ASK_TASK_DESCRIPTION in context.user_data:
-        state = context.user_data[ASK_TASK_DESCRIPTION]
-        task_description = update.message.text.strip()
-        group_id = state['group_id']
-        challenger_user = update.effective_user
-        challenger_name = get_display_name(challenger_user.id, challenger_user.full_name)
-        target_username = state['target_username']
+    state['target_username'] = username
+    set_conversation_step(context, ASK_TASK_DESCRIPTION, state)
+    context.user_data.pop(ASK_TASK_TARGET, None)
+    await update.message.reply_text("What is the simple task you want to ask of them?")
 
-        # Announce in group
-        message = f"{challenger_name.capitalize()} has a task for {target_username}: {task_description}"
-        if 'fag' in challenger_name:
-            message = f"The {challenger_name} has a task for {target_username}: {task_description}"
-        await context.bot.send_message(
-            chat_id=group_id,
-            text=message,
-            parse_mode='HTML'
-        )
 
-        await update.message.reply_text("Your task has been assigned.")
-        context.user_data.pop(ASK_TASK_DESCRIPTION, None)
+async def handle_ask_task_description(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Ask task flow, step 2: the reply is the task."""
+    state = context.user_data[ASK_TASK_DESCRIPTION]
+    task_description = update.message.text.strip()
+    group_id = state['group_id']
+    challenger_user = update.effective_user
+    challenger_name = get_display_name(challenger_user.id, challenger_user.full_name)
+    target_username = state['target_username']
+
+    # Announce in group
+    message = f"{sentence_subject(challenger_name)} has a task for {target_username}: {task_description}"
+    await context.bot.send_message(
+        chat_id=group_id,
+        text=message,
+        parse_mode='HTML'
+    )
+
+    await update.message.reply_text("Your task has been assigned.")
+    context.user_data.pop(ASK_TASK_DESCRIPTION, None)
+
+
+async def handle_admin_help_reason(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin help flow: the reply is the reason, sent to every group admin."""
+    if update.effective_chat.type == "private":
+        await update.message.reply_text("This command can only be used in group chats.")
+        return
+    message = update.message
+    if not message:
         return
+    reason = message.text
+    help_data = context.user_data.get('admin_help', {})
+    help_data['reason'] = reason
+    user = message.from_user
+    display_name = get_display_name(user.id, user.full_name)
+    chat = message.chat
+    replied_message = help_data.get('replied_message')
+    # (kind, file_id) of each media item to forward after the text, resolved once for all admins
+    media = []
+    if replied_message:
+        for kind in ('photo', 'video', 'voice'):
+            item = replied_message.get(kind)
+            if item:
+                # Photos arrive as a list of sizes; forward the largest
+                media.append((kind, item[-1]['file_id'] if kind == 'photo' else item['file_id']))
+    help_text = f"🚨 <b>Admin Help Request</b> 🚨\n" \
+                f"<b>User:</b> {display_name} (ID: {user.id})\n" \
+                f"<b>Group:</b> {getattr(chat, 'title', chat.id)} (ID: {chat.id})\n" \
+                f"<b>Reason:</b> {reason}\n"
+    if replied_message:
+        rep_user_data = replied_message.get('from', {})
+        rep_user_id = rep_user_data.get('id')
+        rep_user_name = get_display_name(rep_user_id, rep_user_data.get('username', 'Unknown'))
+        rep_text = replied_message.get('text', '') or replied_message.get('caption', '')
+        media_only = {'photo': 'image', 'video': 'video', 'voice': 'voice note'}
+        if len(media) == 1 and not rep_text:
+            help_text += f"<b>Replied to:</b> [media: {media_only[media[0][0]]} only]\n"
+        else:
+            help_text += f"<b>Replied to:</b> {rep_user_name} (ID: {rep_user_id})\n"
+            if rep_text:
+                help_text += f"<b>Message:</b> {rep_text}\n"
+    text_kwargs = dict(text=help_text, parse_mode='HTML', disable_web_page_preview=True)
+
+    @limited
+    async def send_help_request(admin_id):
+        # Each admin gets the text first, then any media, in order
+        await context.bot.send_message(chat_id=admin_id, **text_kwargs)
+        for kind, file_id in media:
+            await getattr(context.bot, MEDIA_SEND_METHODS[kind])(admin_id, file_id, caption="[Forwarded from help request]")
+
+    admins = await cached_get_admins(context.bot, chat.id)
+    results = await asyncio.gather(*(send_help_request(admin.user.id) for admin in admins), return_exceptions=True)
+    for admin, result in zip(admins, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Failed to notify admin {admin.user.id} in help request.")
+    await message.reply_text("Your help request has been sent to all group admins.")
+    context.user_data.pop(ADMIN_HELP_STATE, None)
+    context.user_data.pop('admin_help', None)
 
-    # === Admin Help Flow ===
-    if ADMIN_HELP_STATE in context.user_data:
-        if update.effective_chat.type == "private":
-            await update.message.reply_text("This command can only be used in group chats.")
-            return
-        message = update.message
-        if not message:
+async def conversation_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handles all conversation-based interactions after a command has been issued.
+    This acts as a router based on the state stored in context.user_data.
+    """
+    # Update user activity to prevent being kicked for inactivity during a conversation
+    if update.effective_user and update.effective_chat and update.effective_chat.type in ["group", "supergroup"]:
+        update_user_activity(update.effective_user.id, update.effective_chat.id)
+
+    for state_key, handler in CONVERSATION_STATE_HANDLERS:
+        if state_key in context.user_data:
+            await handler(update, context)
             return
-        reason = message.text
-        help_data = context.user_data.get('admin_help', {})
-        help_data['reason'] = reason
-        user = message.from_user
-        display_name = get_display_name(user.id, user.full_name)
-        chat = message.chat
-        replied_message = help_data.get('replied_message')
-        help_text = f"🚨 <b>Admin Help Request</b> 🚨\n" \
-                    f"<b>User:</b> {display_name} (ID: {user.id})\n" \
-                    f"<b>Group:</b> {getattr(chat, 'title', chat.id)} (ID: {chat.id})\n" \
-                    f"<b>Reason:</b> {reason}\n"
-        if replied_message:
-            rep_user_data = replied_message.get('from', {})
-            rep_user_id = rep_user_data.get('id')
-            rep_user_name = get_display_name(rep_user_id, rep_user_data.get('username', 'Unknown'))
-            rep_text = replied_message.get('text', '') or replied_message.get('caption', '')
-            has_photo = 'photo' in replied_message and replied_message['photo']
-            has_video = 'video' in replied_message and replied_message['video']
-            has_voice = 'voice' in replied_message and replied_message['voice']
-            if has_photo and not rep_text and not has_video and not has_voice:
-                help_text += f"<b>Replied to:</b> [media: image only]\n"
-            elif has_video and not rep_text and not has_photo and not has_voice:
-                help_text += f"<b>Replied to:</b> [media: video only]\n"
-            elif has_voice and not rep_text and not has_photo and not has_video:
-                help_text += f"<b>Replied to:</b> [media: voice note only]\n"
-            else:
-                help_text += f"<b>Replied to:</b> {rep_user_name} (ID: {rep_user_id})\n"
-                if rep_text:
-                    help_text += f"<b>Message:</b> {rep_text}\n"
-        admins = await context.bot.get_chat_administrators(chat.id)
-        for admin in admins:
-            try:
-                await context.bot.send_message(
-                    chat_id=admin.user.id,
-                    text=help_text,
-                    parse_mode='HTML',
-                    disable_web_page_preview=True
-                )
-                if replied_message:
-                    if 'photo' in replied_message and replied_message['photo']:
-                        file_id = replied_message['photo'][-1]['file_id']
-                        await context.bot.send_photo(chat_id=admin.user.id, photo=file_id, caption="[Forwarded from help request]")
-                    if 'video' in replied_message and replied_message['video']:
-                        file_id = replied_message['video']['file_id']
-                        await context.bot.send_video(chat_id=admin.user.id, video=file_id, caption="[Forwarded from help request]")
-                    if 'voice' in replied_message and replied_message['voice']:
-                        file_id = replied_message['voice']['file_id']
-                        await context.bot.send_voice(chat_id=admin.user.id, voice=file_id, caption="[Forwarded from help request]")
-            except Exception:
-                logger.warning(f"Failed to notify admin {admin.user.id} in help request.")
-        await message.reply_text("Your help request has been sent to all group admins.")
-        context.user_data.pop(ADMIN_HELP_STATE, None)
-        context.user_data.pop('admin_help', None)
-        return
+
 
 async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -1375,7 +1758,7 @@ async def addreward_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_chat.type == "private":
         await update.message.reply_text("This command can only be used in group chats.")
         return
-    context.user_data[ADDREWARD_STATE] = {'group_id': str(update.effective_chat.id)}
+    set_conversation_step(context, ADDREWARD_STATE, {'group_id': str(update.effective_chat.id)})
     await update.message.reply_text("What is the name of the reward you want to add?")
 
 @command_handler_wrapper(admin_only=True)
@@ -1391,26 +1774,24 @@ async def addpunishment_command(update: Update, context: ContextTypes.DEFAULT_TY
         await update.message.reply_text("Usage: /addpunishment <threshold> <message>")
         return
 
-    try:
-        threshold = int(context.args[0])
-    except ValueError:
+    threshold = parse_int(context.args[0])
+    if threshold is None:
         await update.message.reply_text("Threshold must be a number.")
         return
 
     message = " ".join(context.args[1:])
     group_id = str(update.effective_chat.id)
     punishments_data = load_punishments_data()
-
-    if group_id not in punishments_data:
-        punishments_data[group_id] = []
+    group_punishments = punishments_data.setdefault(group_id, {})
 
     # Check for duplicates
-    for p in punishments_data[group_id]:
-        if p["message"].lower() == message.lower():
-            await update.message.reply_text("A punishment with this message already exists.")
-            return
+    if message.lower() in group_punishments:
+        await update.message.reply_text("A punishment with this message already exists.")
+        return
 
-    punishments_data[group_id].append({"threshold": threshold, "message": message})
+    group_punishments[message.lower()] = {"threshold": threshold, "message": message}
+    # Kept in threshold order on write so /punishment can list it as stored
+    punishments_data[group_id] = _by_threshold(group_punishments.values())
     save_punishments_data(punishments_data)
 
     await update.message.reply_text(f"Punishment added: '{message}' at {threshold} points.")
@@ -1436,10 +1817,7 @@ async def removepunishment_command(update: Update, context: ContextTypes.DEFAULT
         await update.message.reply_text("No punishments found for this group.")
         return
 
-    initial_len = len(punishments_data[group_id])
-    punishments_data[group_id] = [p for p in punishments_data[group_id] if p["message"].lower() != message_to_remove.lower()]
-
-    if len(punishments_data[group_id]) == initial_len:
+    if punishments_data[group_id].pop(message_to_remove.lower(), None) is None:
         await update.message.reply_text("Punishment not found.")
     else:
         save_punishments_data(punishments_data)
@@ -1472,6 +1850,7 @@ async def newgame_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "group_id": update.effective_chat.id,
         "challenger_id": challenger_user.id,
         "opponent_id": opponent_user.id,
+        "created_at": time.time(),
         "game_type": None,
         "challenger_stake": None,
         "opponent_stake": None,
@@ -1523,12 +1902,14 @@ async def loser_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     games_data = load_games_data()
 
-    latest_game_id = None
-    for game_id, game in games_data.items():
-        if str(game.get('group_id')) == str(update.effective_chat.id) and \
-           game.get('status') == 'active' and \
-           (str(game.get('challenger_id')) == str(loser_id) or str(game.get('opponent_id')) == str(loser_id)):
-            latest_game_id = game_id
+    chat_id = update.effective_chat.id
+    latest_game_id = max(
+        (game_id for game_id in active_game_ids(context, games_data, loser_id)
+         if games_data[game_id].get('group_id') == chat_id),
+        # Games from before created_at was recorded count as oldest
+        key=lambda game_id: games_data[game_id].get('created_at', 0),
+        default=None
+    )
 
     if not latest_game_id:
         await update.message.reply_text(f"No active game found for user {loser_username}.")
@@ -1543,37 +1924,23 @@ async def loser_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         winner_id = game['challenger_id']
         loser_stake = game['opponent_stake']
 
-    loser_member = await context.bot.get_chat_member(game['group_id'], loser_id)
-    winner_member = await context.bot.get_chat_member(game['group_id'], winner_id)
-    loser_name = get_display_name(loser_id, loser_member.user.full_name)
-    winner_name = get_display_name(winner_id, winner_member.user.full_name)
-
-    # Determine the message based on whether the loser is a 'fag'
-    message = f"{loser_name.capitalize()} is a loser! They lost {loser_stake['value']} points to {winner_name}."
-    if 'fag' in loser_name:
-        message = f"The {loser_name} is a loser! They lost {loser_stake['value']} points to {winner_name}."
+    loser_name = await get_game_player_name(context, game, loser_id)
+    winner_name = await get_game_player_name(context, game, winner_id)
+    loser_subject = player_subject(game, loser_id, loser_name)
 
     if loser_stake['type'] == 'points':
         await add_user_points(game['group_id'], winner_id, loser_stake['value'], context)
         await add_user_points(game['group_id'], loser_id, -loser_stake['value'], context)
         await context.bot.send_message(
             game['group_id'],
-            message,
+            f"{loser_subject} is a loser! They lost {loser_stake['value']} points to {winner_name}.",
             parse_mode='HTML'
         )
     else:
-        caption = f"{loser_name.capitalize()} is a loser! This was their stake."
-        if 'fag' in loser_name:
-            caption = f"The {loser_name} is a loser! This was their stake."
-
-        if loser_stake['type'] == 'photo':
-            await context.bot.send_photo(game['group_id'], loser_stake['value'], caption=caption, parse_mode='HTML')
-        elif loser_stake['type'] == 'video':
-            await context.bot.send_video(game['group_id'], loser_stake['value'], caption=caption, parse_mode='HTML')
-        elif loser_stake['type'] == 'voice':
-            await context.bot.send_voice(game['group_id'], loser_stake['value'], caption=caption, parse_mode='HTML')
+        caption = f"{loser_subject} is a loser! This was their stake."
+        await send_stake_media(context.bot, game['group_id'], loser_stake, caption)
 
-    game['status'] = 'complete'
+    mark_game_complete(game)
     save_games_data(games_data)
 
 @command_handler_wrapper(admin_only=False)
@@ -1618,16 +1985,13 @@ async def chance_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Jackpot! Your points have been doubled!")
 
     elif outcome == "free_reward":
-        rewards = get_rewards_list(group_id)
-        msg = "<b>You won a free reward!</b>\nChoose one of the following:\n"
-        for r in rewards:
-            msg += f"• <b>{r['name']}</b>\n"
+        msg = "<b>You won a free reward!</b>\nChoose one of the following:\n" + get_rewards_view(group_id).names_html
         msg += "\nReply with the name of the reward you want."
-        context.user_data[FREE_REWARD_SELECTION] = {'group_id': group_id}
+        set_conversation_step(context, FREE_REWARD_SELECTION, {'group_id': group_id})
         await update.message.reply_text(msg, parse_mode='HTML')
     elif outcome == "ask_task":
         await update.message.reply_text("You have won the right to ask a simple task from any of the other boys. Who would you like to ask? (Please provide their @username)")
-        context.user_data[ASK_TASK_TARGET] = {'group_id': group_id}
+        set_conversation_step(context, ASK_TASK_TARGET, {'group_id': group_id})
 
     set_last_played(user_id)
 
@@ -1641,15 +2005,15 @@ async def cleangames_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     games_data = load_games_data()
-    games_to_keep = {
-        game_id: game for game_id, game in games_data.items()
-        if game.get('status') != 'complete'
-    }
+    completed = [game_id for game_id, game in games_data.items() if game.get('status') == 'complete']
 
-    if len(games_to_keep) == len(games_data):
+    if not completed:
         await update.message.reply_text("No completed games to clean up.")
     else:
-        save_games_data(games_to_keep)
+        # Drop them from the shared dict in place rather than rebuilding every kept game
+        for game_id in completed:
+            del games_data[game_id]
+        save_games_data(games_data)
         await update.message.reply_text("Cleaned up completed games.")
 
 @command_handler_wrapper(admin_only=True)
@@ -1663,14 +2027,14 @@ async def punishment_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     group_id = str(update.effective_chat.id)
     punishments_data = load_punishments_data()
-    group_punishments = punishments_data.get(group_id, [])
+    group_punishments = punishments_data.get(group_id, {})
 
     if not group_punishments:
         await update.message.reply_text("No punishments have been set for this group.")
         return
 
     msg = "<b>Configured Punishments:</b>\n"
-    for p in sorted(group_punishments, key=lambda x: x['threshold'], reverse=True):
+    for p in group_punishments.values():
         msg += f"• Below <b>{p['threshold']}</b> points: <i>{p['message']}</i>\n"
 
     await update.message.reply_text(msg, parse_mode='HTML')
@@ -1680,7 +2044,7 @@ async def removereward_command(update: Update, context: ContextTypes.DEFAULT_TYP
     """
     /removereward (admin only): Start remove reward process
     """
-    context.user_data[REMOVEREWARD_STATE] = {'group_id': str(update.effective_chat.id)}
+    set_conversation_step(context, REMOVEREWARD_STATE, {'group_id': str(update.effective_chat.id)})
     await update.message.reply_text("What is the name of the reward you want to remove?")
 
 @command_handler_wrapper(admin_only=True)
@@ -1697,17 +2061,11 @@ async def addpoints_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Usage: /addpoints <username|id> or reply to a user's message.")
             return
         arg = context.args[0].strip()
-        # Try to resolve by ID
-        target_id = None
-        if arg.isdigit():
-            target_id = int(arg)
-        else:
-            target_id = await get_user_id_by_username(context, update.effective_chat.id, arg)
-            # get_chat_member with username will not work unless it's a numeric ID
+        target_id = await resolve_user_id(context, update.effective_chat.id, arg)
     if not target_id:
         await update.message.reply_text(f"Could not resolve user. Please reply to a user's message or provide a valid user ID.")
         return
-    context.user_data[ADDPOINTS_STATE] = {'group_id': group_id, 'target_id': target_id}
+    set_conversation_step(context, ADDPOINTS_STATE, {'group_id': group_id, 'target_id': target_id})
     await update.message.reply_text(f"How many points do you want to add to this user?")
 
 @command_handler_wrapper(admin_only=True)
@@ -1724,17 +2082,11 @@ async def removepoints_command(update: Update, context: ContextTypes.DEFAULT_TYP
             await update.message.reply_text("Usage: /removepoints <username|id> or reply to a user's message.")
             return
         arg = context.args[0].strip()
-        # Try to resolve by ID
-        target_id = None
-        if arg.isdigit():
-            target_id = int(arg)
-        else:
-            target_id = await get_user_id_by_username(context, update.effective_chat.id, arg)
-            # get_chat_member with username will not work unless it's a numeric ID
+        target_id = await resolve_user_id(context, update.effective_chat.id, arg)
     if not target_id:
         await update.message.reply_text(f"Could not resolve user. Please reply to a user's message or provide a valid user ID.")
         return
-    context.user_data[REMOVEPOINTS_STATE] = {'group_id': group_id, 'target_id': target_id}
+    set_conversation_step(context, REMOVEPOINTS_STATE, {'group_id': group_id, 'target_id': target_id})
     await update.message.reply_text(f"How many points do you want to remove from this user?")
 
 @command_handler_wrapper(admin_only=False)
@@ -1744,19 +2096,13 @@ async def point_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     group_id = str(update.effective_chat.id)
     user = update.effective_user
-    is_admin_user = False
-    if update.effective_chat.type in ["group", "supergroup"]:
-        member = await context.bot.get_chat_member(update.effective_chat.id, user.id)
-        is_admin_user = member.status in [ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER]
     # If used as a reply, show replied-to user's points
     if update.message.reply_to_message and update.message.reply_to_message.from_user:
         target_user = update.message.reply_to_message.from_user
         target_id = target_user.id
         points = get_user_points(group_id, target_id)
         display_name = get_display_name(target_id, target_user.full_name)
-        message = f"{display_name.capitalize()} has {points} points."
-        if 'fag' in display_name:
-            message = f"The {display_name} has {points} points."
+        message = f"{sentence_subject(display_name)} has {points} points."
         await update.message.reply_text(message)
         return
     # If no argument, show own points
@@ -1764,18 +2110,15 @@ async def point_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         points = get_user_points(group_id, user.id)
         await update.message.reply_text(f"The fag has {points} points.")
         return
-    # If argument, only allow admin to check others
+    # If argument, only allow admin to check others; only this path needs the member lookup
+    is_admin_user = False
+    if update.effective_chat.type in ["group", "supergroup"]:
+        is_admin_user = await is_chat_admin(context.bot, update.effective_chat.id, user.id)
     if not is_admin_user:
         await update.message.reply_text("You can only check your own points.")
         return
     arg = context.args[0].strip()
-    # Try to resolve by ID
-    target_id = None
-    if arg.isdigit():
-        target_id = int(arg)
-    else:
-        target_id = await get_user_id_by_username(context, update.effective_chat.id, arg)
-        # get_chat_member with username will not work unless it's a numeric ID
+    target_id = await resolve_user_id(context, update.effective_chat.id, arg)
     if not target_id:
         await update.message.reply_text(f"Could not resolve user '{arg}'. Please reply to a user's message or provide a valid user ID.")
         return
@@ -1795,16 +2138,19 @@ async def top5_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not data:
         await update.message.reply_text("No points data for this group yet.")
         return
-    # Sort by points descending
-    top5 = sorted(data.items(), key=lambda x: x[1], reverse=True)[:5]
-    # Fetch usernames if possible
+    # Highest points first; a bounded heap avoids sorting every tracked user
+    top5 = heapq.nlargest(5, data.items(), key=lambda x: x[1])
+    # Fetch usernames if possible, all at once
+    members = await asyncio.gather(
+        *(cached_get_chat_member(context.bot, update.effective_chat.id, uid) for uid, _ in top5),
+        return_exceptions=True
+    )
     lines = ["🎉 <b>Top 5 Point Leaders!</b> 🎉\n"]
-    for idx, (uid, pts) in enumerate(top5, 1):
-        try:
-            member = await context.bot.get_chat_member(update.effective_chat.id, int(uid))
-            name = get_display_name(int(uid), member.user.full_name)
-        except Exception:
+    for idx, ((uid, pts), member) in enumerate(zip(top5, members), 1):
+        if isinstance(member, Exception):
             name = f"User {uid}"
+        else:
+            name = get_display_name(int(uid), member.user.full_name)
         lines.append(f"<b>{idx}.</b> <i>{name}</i> — <b>{pts} points</b> {'🏆' if idx==1 else ''}")
     msg = '\n'.join(lines)
     await update.message.reply_text(msg, parse_mode='HTML')
@@ -1814,40 +2160,70 @@ async def top5_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # =============================
 ACTIVITY_DATA_FILE = 'activity.json'  # Tracks last activity per user per group
 INACTIVE_SETTINGS_FILE = 'inactive_settings.json'  # Stores inactivity threshold per group
+# Inactivity is measured in days, so a user's timestamp is refreshed at most this often (seconds)
+ACTIVITY_RESOLUTION = 60
 
 def load_activity_data():
-    if os.path.exists(ACTIVITY_DATA_FILE):
-        with open(ACTIVITY_DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    return _cached_load(ACTIVITY_DATA_FILE)
 
 def save_activity_data(data):
-    with open(ACTIVITY_DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    _mark_dirty(ACTIVITY_DATA_FILE, data)
 
 def load_inactive_settings():
-    if os.path.exists(INACTIVE_SETTINGS_FILE):
-        with open(INACTIVE_SETTINGS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    return _cached_load(INACTIVE_SETTINGS_FILE)
 
 def save_inactive_settings(data):
-    with open(INACTIVE_SETTINGS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    _save_json(INACTIVE_SETTINGS_FILE, data)
 
 def update_user_activity(user_id, group_id):
     data = load_activity_data()
-    group_id = str(group_id)
+    group_activity = data.setdefault(str(group_id), {})
     user_id = str(user_id)
-    if group_id not in data:
-        data[group_id] = {}
-    data[group_id][user_id] = int(time.time())
+    now = int(time.time())
+    # Chatty users would otherwise dirty activity.json (and log a line) on every message
+    if now - group_activity.get(user_id, 0) < ACTIVITY_RESOLUTION:
+        return
+    group_activity[user_id] = now
     save_activity_data(data)
     logger.debug(f"Updated activity for user {user_id} in group {group_id}")
 
 # =============================
 # Hashtag Message Handler
 # =============================
+HASHTAG_RE = re.compile(r'#(\w+)')
+# Albums arrive as one message per item, so they're collected per (tag, media_group_id)
+# and saved as a single entry once no new item has arrived for this many seconds
+MEDIA_GROUP_FLUSH_DELAY = 1.5
+# (tag, media_group_id) -> entry being collected; 'seen' holds the file ids already added
+media_group_cache = {}
+# (tag, media_group_id) -> pending flush_media_group task, restarted by each new item
+flush_tasks = {}
+# media_group_id -> tags it is being collected under; only one item of an album usually
+# carries the caption, so the album's other items are added to these tags too
+media_group_tags = {}
+
+async def flush_media_group(tag, media_group_id, chat_id, context: ContextTypes.DEFAULT_TYPE):
+    """Saves a collected media group under its tag once the album has stopped arriving."""
+    await asyncio.sleep(MEDIA_GROUP_FLUSH_DELAY)
+    cache_key = (tag, media_group_id)
+    flush_tasks.pop(cache_key, None)
+    group = media_group_cache.pop(cache_key, None)
+    tags = media_group_tags.get(media_group_id)
+    if tags:
+        tags.remove(tag)
+        if not tags:
+            del media_group_tags[media_group_id]
+    if group is None:
+        return
+    # The side index only de-duplicates while collecting; it isn't stored
+    del group['seen']
+    group['media_group_id'] = media_group_id
+    data = load_hashtag_data()
+    data.setdefault(tag, []).append(group)
+    save_hashtag_data(data)
+    logger.debug(f"Saved media group {media_group_id} under tag #{tag}")
+    await context.bot.send_message(chat_id, f"Saved under: #{tag}", reply_to_message_id=group['message_id'])
+
 async def hashtag_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Handles messages containing hashtags, saving them (and any media) for later retrieval.
@@ -1862,64 +2238,64 @@ async def hashtag_message_handler(update: Update, context: ContextTypes.DEFAULT_
     if message.chat and message.from_user and message.chat.type in ["group", "supergroup"]:
         update_user_activity(message.from_user.id, message.chat.id)
     text = message.text or message.caption or ''
-    hashtags = re.findall(r'#(\w+)', text)
+    # Most messages have no hashtag; a substring scan is far cheaper than the regex
+    # Tags are stored lowercase, so repeats like "#a #A" are saved once (first-seen order kept)
+    hashtags = list(dict.fromkeys(tag.lower() for tag in HASHTAG_RE.findall(text))) if '#' in text else None
+    media_group_id = message.media_group_id
+    if not hashtags and media_group_id:
+        # An uncaptioned item of an album that is being collected goes under the album's tags
+        hashtags = list(media_group_tags.get(media_group_id, ()))
     if not hashtags:
         logger.debug("No hashtags found in message.")
         return
+    # Everything saved is read from the message once, not once per tag
+    base_entry = {
+        'user_id': message.from_user.id,
+        'username': message.from_user.username,
+        'text': message.text if message.text else None,
+        'caption': message.caption if message.caption else None,
+        'message_id': message.message_id,
+        'chat_id': message.chat_id,
+    }
+    # Only the last photo size (highest resolution) is kept
+    photo_id = message.photo[-1].file_id if message.photo else None
+    video_ids = [message.video.file_id] if message.video else []
+    # Documents count as videos when their type says so
+    if message.document and message.document.mime_type and message.document.mime_type.startswith('video'):
+        video_ids.append(message.document.file_id)
     # Handle media groups (multiple media sent together)
-    if message.media_group_id:
+    if media_group_id:
         for tag in hashtags:
-            tag = tag.lower()
-            cache_key = (tag, message.media_group_id)
-            group = media_group_cache.setdefault(cache_key, {
-                'user_id': message.from_user.id,
-                'username': message.from_user.username,
-                'text': message.text if message.text else None,
-                'caption': message.caption if message.caption else None,
-                'message_id': message.message_id,
-                'chat_id': message.chat_id,
-                'photos': [],
-                'videos': []
-            })
-            # Add only the last photo (highest resolution) and avoid duplicates
-            if message.photo:
-                file_id = message.photo[-1].file_id
-                if file_id not in group['photos']:
-                    group['photos'].append(file_id)
-            # Add video
-            if message.video:
-                group['videos'].append(message.video.file_id)
-            # Add document if it's a video
-            if message.document and message.document.mime_type and message.document.mime_type.startswith('video'):
-                group['videos'].append(message.document.file_id)
+            cache_key = (tag, media_group_id)
+            group = media_group_cache.get(cache_key)
+            if group is None:
+                group = media_group_cache[cache_key] = {**base_entry, 'photos': [], 'videos': [], 'seen': set()}
+                media_group_tags.setdefault(media_group_id, []).append(tag)
+            seen = group['seen']
+            # Add media, avoiding duplicates
+            if photo_id and photo_id not in seen:
+                seen.add(photo_id)
+                group['photos'].append(photo_id)
+            for file_id in video_ids:
+                if file_id not in seen:
+                    seen.add(file_id)
+                    group['videos'].append(file_id)
             # Cancel and reschedule flush timer
             if cache_key in flush_tasks:
                 flush_tasks[cache_key].cancel()
-            flush_tasks[cache_key] = asyncio.create_task(flush_media_group(tag, message.media_group_id, message.chat_id, context))
+            flush_tasks[cache_key] = asyncio.create_task(flush_media_group(tag, media_group_id, base_entry['chat_id'], context))
             logger.debug(f"Scheduled flush for media group {cache_key}")
         # Do not send reply here; reply will be sent after flush
         return
     # Handle single media or text
     data = load_hashtag_data()
     for tag in hashtags:
-        tag = tag.lower()
         entry = {
-            'user_id': message.from_user.id,
-            'username': message.from_user.username,
-            'text': message.text if message.text else None,
-            'caption': message.caption if message.caption else None,
-            'message_id': message.message_id,
-            'chat_id': message.chat_id,
+            **base_entry,
             'media_group_id': None,
-            'photos': [],
-            'videos': []
+            'photos': [photo_id] if photo_id else [],
+            'videos': list(video_ids)
         }
-        if message.photo:
-            entry['photos'] = [message.photo[-1].file_id]
-        if message.video:
-            entry['videos'] = [message.video.file_id]
-        if message.document and message.document.mime_type and message.document.mime_type.startswith('video'):
-            entry['videos'].append(message.document.file_id)
         data.setdefault(tag, []).append(entry)
         logger.debug(f"Saved single message under tag #{tag}")
     save_hashtag_data(data)
@@ -1928,6 +2304,11 @@ async def hashtag_message_handler(update: Update, context: ContextTypes.DEFAULT_
 # =============================
 # Dynamic Hashtag Command Handler
 # =============================
+# Saved entries a hashtag command sends at the same time
+HASHTAG_SEND_CONCURRENCY = 5
+# Telegram's limit on the items in one album
+MEDIA_GROUP_MAX_ITEMS = 10
+
 async def dynamic_hashtag_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Handles dynamic hashtag commands (e.g. /mytag) to retrieve saved messages/media.
@@ -1953,21 +2334,38 @@ async def dynamic_hashtag_command(update: Update, context: ContextTypes.DEFAULT_
         logger.debug(f"No data found for command: {command}")
         return
     # No admin check: allow all users to use hashtag commands
-    found = False
-    for entry in data[command]:
-        # Send all photos
-        for photo_id in entry.get('photos', []):
-            await update.message.reply_photo(photo_id, caption=entry.get('caption') or entry.get('text') or '')
-            found = True
-        # Send all videos
-        for video_id in entry.get('videos', []):
-            await update.message.reply_video(video_id, caption=entry.get('caption') or entry.get('text') or '')
-            found = True
-        # Fallback for text/caption only
-        if not entry.get('photos') and not entry.get('videos') and (entry.get('text') or entry.get('caption')):
-            await update.message.reply_text(entry.get('text') or entry.get('caption'))
-            found = True
-    if not found:
+    entries = [
+        entry for entry in data[command]
+        if entry.get('photos') or entry.get('videos') or entry.get('text') or entry.get('caption')
+    ]
+    # A few entries go out at once; more would run into Telegram's per-group rate limit
+    sem = asyncio.Semaphore(HASHTAG_SEND_CONCURRENCY)
+
+    async def send_entry(entry):
+        # Each entry's media goes out as albums, so its photos and videos stay together and in order
+        media = [InputMediaPhoto(file_id) for file_id in entry.get('photos', [])] + \
+                [InputMediaVideo(file_id) for file_id in entry.get('videos', [])]
+        caption = entry.get('caption') or entry.get('text') or ''
+        async with sem:
+            if not media:
+                # Fallback for text/caption only
+                await limited(update.message.reply_text)(entry.get('text') or entry.get('caption'))
+                return
+            for start in range(0, len(media), MEDIA_GROUP_MAX_ITEMS):
+                chunk = media[start:start + MEDIA_GROUP_MAX_ITEMS]
+                chunk_caption = caption if start == 0 else None
+                if len(chunk) > 1:
+                    await limited(update.message.reply_media_group)(chunk, caption=chunk_caption)
+                elif isinstance(chunk[0], InputMediaPhoto):
+                    await limited(update.message.reply_photo)(chunk[0].media, caption=chunk_caption)
+                else:
+                    await limited(update.message.reply_video)(chunk[0].media, caption=chunk_caption)
+
+    results = await asyncio.gather(*(send_entry(entry) for entry in entries), return_exceptions=True)
+    for entry, result in zip(entries, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Failed to send saved message {entry.get('message_id')} for #{command}: {result}")
+    if not entries:
         await update.message.reply_text(f"No saved messages or photos for #{command}.")
         logger.debug(f"No saved messages or media for command: {command}")
 
@@ -1985,6 +2383,9 @@ COMMAND_MAP = {
     'addpoints': {'is_admin': True}, 'removepoints': {'is_admin': True},
     'point': {'is_admin': False}, 'top5': {'is_admin': True}, 'setnickname': {'is_admin': True},
 }
+# /command listings in display order; /start and /help aren't shown in groups
+EVERYONE_COMMANDS = tuple(cmd for cmd, info in sorted(COMMAND_MAP.items()) if not info['is_admin'] and cmd not in ('start', 'help'))
+ADMIN_COMMANDS = tuple(cmd for cmd, info in sorted(COMMAND_MAP.items()) if info['is_admin'])
 
 @command_handler_wrapper(admin_only=False)
 async def command_list_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1996,32 +2397,19 @@ async def command_list_command(update: Update, context: ContextTypes.DEFAULT_TYP
         return
 
     group_id = str(update.effective_chat.id)
-    disabled_cmds = set(load_disabled_commands().get(group_id, []))
+    disabled_cmds = get_disabled_commands(group_id)
 
-    member = await context.bot.get_chat_member(update.effective_chat.id, update.effective_user.id)
-    is_admin_user = member.status in [ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER]
+    is_admin_user = await is_chat_admin(context.bot, update.effective_chat.id, update.effective_user.id)
 
-    everyone_cmds = []
+    # Static commands from COMMAND_MAP; admins also see disabled everyone commands
+    everyone_cmds = [
+        f"/{cmd} (disabled)" if cmd in disabled_cmds else f"/{cmd}"
+        for cmd in EVERYONE_COMMANDS
+        if is_admin_user or cmd not in disabled_cmds
+    ]
     admin_only_cmds = []
-
-    # Static commands from COMMAND_MAP
-    for cmd, info in sorted(COMMAND_MAP.items()):
-        if cmd in ['start', 'help']:  # Don't show these in the group list
-            continue
-
-        is_disabled = cmd in disabled_cmds
-        display_cmd = f"/{cmd}"
-        if is_disabled:
-            display_cmd += " (disabled)"
-
-        if info['is_admin']:
-            if is_admin_user:  # Admins see all admin commands
-                admin_only_cmds.append(display_cmd)
-        else:  # Everyone commands
-            if not is_disabled:
-                everyone_cmds.append(display_cmd)
-            elif is_admin_user:  # Admins also see disabled everyone commands
-                everyone_cmds.append(display_cmd)
+    if is_admin_user:  # Admins see all admin commands
+        admin_only_cmds = [f"/{cmd} (disabled)" if cmd in disabled_cmds else f"/{cmd}" for cmd in ADMIN_COMMANDS]
 
     # Dynamic hashtag commands (always admin-only)
     if is_admin_user:
@@ -2039,14 +2427,25 @@ async def command_list_command(update: Update, context: ContextTypes.DEFAULT_TYP
 DISABLED_COMMANDS_FILE = 'disabled_commands.json'
 
 def load_disabled_commands():
-    if os.path.exists(DISABLED_COMMANDS_FILE):
-        with open(DISABLED_COMMANDS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    return _cached_load(DISABLED_COMMANDS_FILE)
 
 def save_disabled_commands(data):
-    with open(DISABLED_COMMANDS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    _save_json(DISABLED_COMMANDS_FILE, data)
+    _DISABLED_SETS.clear()
+
+# chat id -> (disabled_commands.json mtime, frozenset of disabled command names)
+_DISABLED_SETS = {}
+
+def get_disabled_commands(chat_id) -> frozenset:
+    """Returns the commands disabled in a chat, converting the stored list to a set only when the file changes."""
+    data = load_disabled_commands()
+    mtime = _JSON_CACHE[DISABLED_COMMANDS_FILE][0]
+    chat_id = str(chat_id)
+    cached = _DISABLED_SETS.get(chat_id)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, frozenset(data.get(chat_id, [])))
+        _DISABLED_SETS[chat_id] = cached
+    return cached[1]
 
 # /remove - Remove a dynamic hashtag command or disable a static command (admin only)
 @command_handler_wrapper(admin_only=True)
@@ -2072,10 +2471,11 @@ async def remove_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if tag in COMMAND_MAP:
         group_id = str(update.effective_chat.id)
         disabled = load_disabled_commands()
-        disabled.setdefault(group_id, set())
-        # Convert to list for JSON
-        disabled[group_id] = list(set(disabled.get(group_id, [])) | {tag})
-        save_disabled_commands(disabled)
+        # Stored as a list for JSON; get_disabled_commands gives the set view for lookups
+        group_disabled = disabled.setdefault(group_id, [])
+        if tag not in group_disabled:
+            group_disabled.append(tag)
+            save_disabled_commands(disabled)
         await update.message.reply_text(f"Command /{tag} has been disabled in this group. Admins can re-enable it with /enable {tag}.")
         return
     await update.message.reply_text(f"No such dynamic or static command: /{tag}")
@@ -2095,8 +2495,7 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     # Check if disabled in this group
     group_id = str(update.effective_chat.id)
-    disabled = load_disabled_commands()
-    if 'admin' in disabled.get(group_id, []):
+    if 'admin' in get_disabled_commands(group_id):
         return
     message = update.message
     if not message:
@@ -2114,7 +2513,7 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         'reason': None
     }
     await message.reply_text("Please describe the reason you need admin help. Your request will be sent to all group admins.")
-    context.user_data[ADMIN_HELP_STATE] = True
+    set_conversation_step(context, ADMIN_HELP_STATE, True)
 
 
 @command_handler_wrapper(admin_only=True)
@@ -2185,12 +2584,19 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     # Check if disabled in this group (should never trigger in private)
     group_id = str(update.effective_chat.id)
-    disabled = load_disabled_commands()
-    if 'start' in disabled.get(group_id, []):
+    if 'start' in get_disabled_commands(group_id):
         return
     await update.message.reply_text('Hey there fag! What can I help you with?')
 
 #Help command
+HELP_MENU_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("General Commands", callback_data='help_general')],
+    [InlineKeyboardButton("Game Commands", callback_data='help_games')],
+    [InlineKeyboardButton("Point System", callback_data='help_points')],
+    [InlineKeyboardButton("Admin Commands", callback_data='help_admin')],
+])
+HELP_BACK_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("« Back to Main Menu", callback_data='help_back')]])
+
 @command_handler_wrapper(admin_only=False)
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -2200,17 +2606,9 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Please use the /help command in a private chat with me for a better experience.")
         return
 
-    keyboard = [
-        [InlineKeyboardButton("General Commands", callback_data='help_general')],
-        [InlineKeyboardButton("Game Commands", callback_data='help_games')],
-        [InlineKeyboardButton("Point System", callback_data='help_points')],
-        [InlineKeyboardButton("Admin Commands", callback_data='help_admin')],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
     await update.message.reply_text(
         "Welcome to the help menu! Please choose a category:",
-        reply_markup=reply_markup
+        reply_markup=HELP_MENU_MARKUP
     )
 
 async def help_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -2221,7 +2619,6 @@ async def help_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     topic = query.data
 
     text = ""
-    keyboard = [[InlineKeyboardButton("« Back to Main Menu", callback_data='help_back')]]
 
     if topic == 'help_general':
         text = """
@@ -2262,19 +2659,13 @@ Due to Telegram limitations, I cannot know if you are an admin in a private chat
 To see the full list of admin commands available to you in a specific group, please go to that group and use the `/command` command.
         """
     elif topic == 'help_back':
-        main_menu_keyboard = [
-            [InlineKeyboardButton("General Commands", callback_data='help_general')],
-            [InlineKeyboardButton("Game Commands", callback_data='help_games')],
-            [InlineKeyboardButton("Point System", callback_data='help_points')],
-            [InlineKeyboardButton("Admin Commands", callback_data='help_admin')],
-        ]
         await query.edit_message_text(
             "Welcome to the help menu! Please choose a category:",
-            reply_markup=InlineKeyboardMarkup(main_menu_keyboard)
+            reply_markup=HELP_MENU_MARKUP
         )
         return
 
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML', disable_web_page_preview=True)
+    await query.edit_message_text(text, reply_markup=HELP_BACK_MARKUP, parse_mode='HTML', disable_web_page_preview=True)
 
 #BeOwned command
 @command_handler_wrapper(admin_only=False)
@@ -2285,16 +2676,17 @@ async def beowned_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Check if disabled in this group
     if update.effective_chat.type != "private":
         group_id = str(update.effective_chat.id)
-        disabled = load_disabled_commands()
-        if 'beowned' in disabled.get(group_id, []):
+        if 'beowned' in get_disabled_commands(group_id):
             return
     await update.message.reply_text(
         "If you want to be Lion's property, contact @Lionspridechatbot with a head to toe nude picture of yourself and a clear, concise and complete presentation of yourself.")
 
 #Responses
+# Case-insensitive search, so group messages aren't copied by lower() just to be checked
+DOG_RE = re.compile('dog', re.IGNORECASE)
+
 def handle_response(text: str) -> str:
-    processed: str = text.lower()
-    if 'dog' in processed:
+    if DOG_RE.search(text):
         return 'Is @Luke082 here? Someone should use his command (/luke8)!'
 
 async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -2322,9 +2714,15 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
     # Build the message with some markup and additional information about what happened.
     # You might need to add some logic to deal with messages longer than the 4096 character limit.
     update_str = update.to_dict() if isinstance(update, Update) else str(update)
+    # Errors tend to come in bursts during outages, so use the fast serializer when there is one
+    try:
+        update_json = orjson.dumps(update_str, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    except Exception:
+        # orjson is missing or rejected the data (e.g. an integer wider than 64 bits)
+        update_json = json.dumps(update_str, indent=2, ensure_ascii=False)
     message = (
         f"An exception was raised while handling an update\n"
-        f"<pre>update = {html.escape(json.dumps(update_str, indent=2, ensure_ascii=False))}</pre>\n\n"
+        f"<pre>update = {html.escape(update_json)}</pre>\n\n"
         f"<pre>context.chat_data = {html.escape(str(context.chat_data))}</pre>\n\n"
         f"<pre>context.user_data = {html.escape(str(context.user_data))}</pre>\n\n"
         f"<pre>{html.escape(tb_string)}</pre>"
@@ -2338,23 +2736,68 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
 # =============================
 GAME_SELECTION, ROUND_SELECTION, STAKE_TYPE_SELECTION, STAKE_SUBMISSION_POINTS, STAKE_SUBMISSION_MEDIA, OPPONENT_SELECTION, CONFIRMATION, FREE_REWARD_SELECTION, ASK_TASK_TARGET, ASK_TASK_DESCRIPTION = range(10)
 
+# Callback data patterns for the game setup flow. The named groups are read back
+# through context.match, so the handlers never have to split query.data themselves.
+GAME_ID_PATTERN = r'(?P<game_id>[0-9a-f-]+)'
+START_GAME_SETUP_PATTERN = rf'^start_game_setup_{GAME_ID_PATTERN}$'
+GAME_SELECTION_PATTERN = r'^(?P<game_type>game_(?:dice|connect_four|battleship))$'
+ROUND_SELECTION_PATTERN = r'^rounds_(?P<rounds>3|5|9)$'
+STAKE_TYPE_PATTERN = r'^stake_(?P<stake_type>points|media)$'
+CONFIRM_GAME_PATTERN = rf'^confirm_game_{GAME_ID_PATTERN}$'
+RESTART_GAME_PATTERN = rf'^restart_game_{GAME_ID_PATTERN}$'
+CANCEL_GAME_PATTERN = rf'^cancel_game_{GAME_ID_PATTERN}$'
+CHALLENGE_RESPONSE_PATTERN = rf'^(?P<response>accept|refuse)_challenge_{GAME_ID_PATTERN}$'
+# In-game move callbacks
+C4_MOVE_PATTERN = rf'^c4_move_{GAME_ID_PATTERN}_(?P<col>[0-6])$'
+BS_START_PLACEMENT_PATTERN = rf'^bs_start_placement_{GAME_ID_PATTERN}$'
+BS_ATTACK_PATTERN = rf'^bs_attack_{GAME_ID_PATTERN}_(?P<row>\d)_(?P<col>\d)$'
+# Sent by turn messages from before the one-tap attack keyboard
+BS_LEGACY_COL_PATTERN = rf'^bs_col_{GAME_ID_PATTERN}_(?P<col>\d)$'
+
+# The setup keyboards don't depend on the game, so they are built once and shared
+GAME_CHOICE_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Dice Game", callback_data='game_dice')],
+    [InlineKeyboardButton("Connect Four", callback_data='game_connect_four')],
+    [InlineKeyboardButton("Battleship", callback_data='game_battleship')],
+])
+ROUNDS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Best of 3", callback_data='rounds_3')],
+    [InlineKeyboardButton("Best of 5", callback_data='rounds_5')],
+    [InlineKeyboardButton("Best of 9", callback_data='rounds_9')],
+])
+STAKE_TYPE_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Points", callback_data='stake_points')],
+    [InlineKeyboardButton("Media (Photo, Video, Voice Note)", callback_data='stake_media')],
+])
+
+# Callback data for the per-game buttons, matched by the *_PATTERN constants above
+GAME_CALLBACK_TEMPLATES = {
+    'confirm': 'confirm_game_{}',
+    'cancel': 'cancel_game_{}',
+    'restart': 'restart_game_{}',
+    'accept': 'accept_challenge_{}',
+    'refuse': 'refuse_challenge_{}',
+}
+
+def get_game_callbacks(context: ContextTypes.DEFAULT_TYPE, game_id: str) -> dict:
+    """Returns the callback data for a game's buttons, built once per conversation and kept in user_data."""
+    cb = context.user_data.get('cb')
+    if not cb or cb['game_id'] != game_id:
+        cb = {key: template.format(game_id) for key, template in GAME_CALLBACK_TEMPLATES.items()}
+        cb['game_id'] = game_id
+        context.user_data['cb'] = cb
+    return cb
+
 async def start_game_setup(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Starts the game setup conversation."""
     query = update.callback_query
     await query.answer()
-    game_id = query.data.split('_')[-1]
+    game_id = context.match['game_id']
     context.user_data['game_id'] = game_id
 
-    keyboard = [
-        [InlineKeyboardButton("Dice Game", callback_data='game_dice')],
-        [InlineKeyboardButton("Connect Four", callback_data='game_connect_four')],
-        [InlineKeyboardButton("Battleship", callback_data='game_battleship')],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
     await query.edit_message_text(
         text="Please select the game you want to play:",
-        reply_markup=reply_markup
+        reply_markup=GAME_CHOICE_MARKUP
     )
     return GAME_SELECTION
 
@@ -2362,7 +2805,7 @@ async def game_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """Handles the game selection."""
     query = update.callback_query
     await query.answer()
-    game_type = query.data
+    game_type = context.match['game_type']
 
     game_id = context.user_data['game_id']
     games_data = load_games_data()
@@ -2377,27 +2820,16 @@ async def game_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     save_games_data(games_data)
 
     if game_type == 'game_dice':
-        keyboard = [
-            [InlineKeyboardButton("Best of 3", callback_data='rounds_3')],
-            [InlineKeyboardButton("Best of 5", callback_data='rounds_5')],
-            [InlineKeyboardButton("Best of 9", callback_data='rounds_9')],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(
             text="How many rounds would you like to play?",
-            reply_markup=reply_markup
+            reply_markup=ROUNDS_MARKUP
         )
         return ROUND_SELECTION
     else:
         # Placeholder for other games
-        keyboard = [
-            [InlineKeyboardButton("Points", callback_data='stake_points')],
-            [InlineKeyboardButton("Media (Photo, Video, Voice Note)", callback_data='stake_media')],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(
             text="What would you like to stake?",
-            reply_markup=reply_markup
+            reply_markup=STAKE_TYPE_MARKUP
         )
         return STAKE_TYPE_SELECTION
 
@@ -2405,22 +2837,16 @@ async def round_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """Handles the round selection for the Dice Game."""
     query = update.callback_query
     await query.answer()
-    rounds = int(query.data.split('_')[-1])
+    rounds = int(context.match['rounds'])
 
     game_id = context.user_data['game_id']
     games_data = load_games_data()
     games_data[game_id]['rounds_to_play'] = rounds
     save_games_data(games_data)
 
-    keyboard = [
-        [InlineKeyboardButton("Points", callback_data='stake_points')],
-        [InlineKeyboardButton("Media (Photo, Video, Voice Note)", callback_data='stake_media')],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
     await query.edit_message_text(
         text="What would you like to stake?",
-        reply_markup=reply_markup
+        reply_markup=STAKE_TYPE_MARKUP
     )
     return STAKE_TYPE_SELECTION
 
@@ -2428,99 +2854,128 @@ async def stake_type_selection(update: Update, context: ContextTypes.DEFAULT_TYP
     """Handles the stake type selection."""
     query = update.callback_query
     await query.answer()
-    stake_type = query.data
+    stake_type = context.match['stake_type']
 
-    if stake_type == 'stake_points':
+    if stake_type == 'points':
         await query.edit_message_text(text="How many points would you like to stake?")
         return STAKE_SUBMISSION_POINTS
-    elif stake_type == 'stake_media':
+    elif stake_type == 'media':
         await query.edit_message_text(text="Please send the media file you would like to stake (photo, video, or voice note).")
         return STAKE_SUBMISSION_MEDIA
 
-async def stake_submission_points(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Handles the submission of points as a stake."""
-    logger.debug("In stake_submission_points")
-    try:
-        points = int(update.message.text)
-        user_id = update.effective_user.id
-        game_id = context.user_data['game_id']
-        games_data = load_games_data()
-        group_id = games_data[game_id]['group_id']
+async def _finalize_opponent_stake(context: ContextTypes.DEFAULT_TYPE, game_id: str, games_data: dict) -> int:
+    """Activates a game once the opponent has submitted their stake and announces it in the group."""
+    game = games_data[game_id]
+    # Look the players up before touching the game: the dict is the shared cached copy, so a
+    # failed lookup must not leave a half-activated game behind for the next save to write out
+    challenger = await cached_get_chat_member(context.bot, game['group_id'], game['challenger_id'])
+    opponent = await cached_get_chat_member(context.bot, game['group_id'], game['opponent_id'])
+
+    if game['game_type'] == 'game_dice':
+        game['current_round'] = 1
+        game['challenger_score'] = 0
+        game['opponent_score'] = 0
+        game['last_roll'] = None
+    game['status'] = 'active'
+    # Resolve display names once so the game handlers don't refetch them every round
+    game['challenger_display'] = get_display_name(game['challenger_id'], challenger.user.full_name)
+    game['opponent_display'] = get_display_name(game['opponent_id'], opponent.user.full_name)
+    game['challenger_is_f'] = is_f_name(game['challenger_display'])
+    game['opponent_is_f'] = is_f_name(game['opponent_display'])
+
+    if game['game_type'] == 'game_battleship':
+        challenger_id = str(game['challenger_id'])
+        opponent_id = str(game['opponent_id'])
+        game['boards'] = {
+            challenger_id: [[0] * 10 for _ in range(10)],
+            opponent_id: [[0] * 10 for _ in range(10)]
+        }
+        game['ships'] = {challenger_id: {}, opponent_id: {}}
+        game['placement_complete'] = {challenger_id: False, opponent_id: False}
+        game['turn'] = game['challenger_id']
 
-        user_points = get_user_points(group_id, user_id)
-        if user_points < points:
-            await update.message.reply_text(f"You don't have enough points. You have {user_points}, but you tried to stake {points}. Please enter a valid amount.")
-            return STAKE_SUBMISSION_POINTS
+    # One write covers the stake, the activation and any board setup
+    save_games_data(games_data)
+    index_active_game(context, games_data, game_id)
 
-        if context.user_data.get('player_role') == 'opponent':
-            games_data[game_id]['opponent_stake'] = {"type": "points", "value": points}
-        else:
-            games_data[game_id]['challenger_stake'] = {"type": "points", "value": points}
-        save_games_data(games_data)
+    await context.bot.send_message(
+        chat_id=game['group_id'],
+        text=f"The game between {challenger.user.mention_html()} and {opponent.user.mention_html()} is on!",
+        parse_mode='HTML'
+    )
 
-        if context.user_data.get('player_role') == 'opponent':
-            game = games_data[game_id]
-            if game['game_type'] == 'game_dice':
-                game['current_round'] = 1
-                game['challenger_score'] = 0
-                game['opponent_score'] = 0
-                game['last_roll'] = None
-            game['status'] = 'active'
-            save_games_data(games_data)
-            challenger = await context.bot.get_chat_member(game['group_id'], game['challenger_id'])
-            opponent = await context.bot.get_chat_member(game['group_id'], game['opponent_id'])
+    if game['game_type'] == 'game_connect_four':
+        board_text, reply_markup = create_connect_four_board_markup(game['board'], game_id)
+        await context.bot.send_message(
+            chat_id=game['group_id'],
+            text=f"<b>Connect Four!</b>\n\n{board_text}\nIt's {challenger.user.mention_html()}'s turn.",
+            reply_markup=reply_markup,
+            parse_mode='HTML'
+        )
+    elif game['game_type'] == 'game_battleship':
+        placement_keyboard = [[InlineKeyboardButton("Begin Ship Placement", callback_data=f'bs_start_placement_{game_id}')]]
+        placement_markup = InlineKeyboardMarkup(placement_keyboard)
+        try:
             await context.bot.send_message(
-                chat_id=game['group_id'],
-                text=f"The game between {challenger.user.mention_html()} and {opponent.user.mention_html()} is on!",
-                parse_mode='HTML'
+                chat_id=game['challenger_id'],
+                text="Your Battleship game is ready! It's time to place your ships.",
+                reply_markup=placement_markup
             )
+            await context.bot.send_message(
+                chat_id=game['opponent_id'],
+                text="Your Battleship game is ready! It's time to place your ships.",
+                reply_markup=placement_markup
+            )
+        except Exception:
+            logger.exception("Error sending battleship placement message")
 
-            if game['game_type'] == 'game_connect_four':
-                challenger_member = await context.bot.get_chat_member(game['group_id'], game['challenger_id'])
-                board_text, reply_markup = create_connect_four_board_markup(game['board'], game_id)
-                await context.bot.send_message(
-                    chat_id=game['group_id'],
-                    text=f"<b>Connect Four!</b>\n\n{board_text}\nIt's {challenger_member.user.mention_html()}'s turn.",
-                    reply_markup=reply_markup,
-                    parse_mode='HTML'
-                )
-            elif game['game_type'] == 'game_battleship':
-                challenger_id = str(game['challenger_id'])
-                opponent_id = str(game['opponent_id'])
-                game['boards'] = {
-                    challenger_id: [[0] * 10 for _ in range(10)],
-                    opponent_id: [[0] * 10 for _ in range(10)]
-                }
-                game['ships'] = {challenger_id: {}, opponent_id: {}}
-                game['placement_complete'] = {challenger_id: False, opponent_id: False}
-                game['turn'] = game['challenger_id']
-                save_games_data(games_data)
-
-                placement_keyboard = [[InlineKeyboardButton("Begin Ship Placement", callback_data=f'bs_start_placement_{game_id}')]]
-                placement_markup = InlineKeyboardMarkup(placement_keyboard)
-                try:
-                    await context.bot.send_message(
-                        chat_id=game['challenger_id'],
-                        text="Your Battleship game is ready! It's time to place your ships.",
-                        reply_markup=placement_markup
-                    )
-                    await context.bot.send_message(
-                        chat_id=game['opponent_id'],
-                        text="Your Battleship game is ready! It's time to place your ships.",
-                        reply_markup=placement_markup
-                    )
-                except Exception as e:
-                    print(f"Error sending battleship placement message: {e}")
-
-            return ConversationHandler.END
-        else:
-            # Since opponent is already selected, go straight to confirmation
-            return await show_confirmation(update, context)
+    return ConversationHandler.END
+
+async def get_game_player_name(context: ContextTypes.DEFAULT_TYPE, game: dict, user_id) -> str:
+    """Returns a player's display name, preferring the one cached on the game at activation."""
+    role = 'challenger' if str(user_id) == str(game['challenger_id']) else 'opponent'
+    cached_name = game.get(f'{role}_display')
+    if cached_name:
+        return cached_name
+    member = await cached_get_chat_member(context.bot, game['group_id'], user_id)
+    return get_display_name(user_id, member.user.full_name)
+
+def player_subject(game: dict, user_id, name: str) -> str:
+    """Formats a player's name to open a sentence, using the flag cached on the game when present."""
+    role = 'challenger' if str(user_id) == str(game['challenger_id']) else 'opponent'
+    return sentence_subject(name, game.get(f'{role}_is_f'))
 
-    except ValueError:
-        await update.message.reply_text("Please enter a valid number of points.")
+async def stake_submission_points(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Handles the submission of points as a stake."""
+    logger.debug("In stake_submission_points")
+    text = update.message.text.strip()
+    # Validate up front instead of catching int() errors: isdecimal (not isdigit) accepts exactly
+    # the digits int() does, and the length cap keeps huge inputs cheap to reject
+    if not text.isdecimal() or len(text) > 9 or int(text) == 0:
+        await update.message.reply_text("Please enter a valid positive number of points (up to 999999999).")
         return STAKE_SUBMISSION_POINTS
 
+    points = int(text)
+    user_id = update.effective_user.id
+    game_id = context.user_data['game_id']
+    games_data = load_games_data()
+    group_id = games_data[game_id]['group_id']
+
+    user_points = get_user_points(group_id, user_id)
+    if user_points < points:
+        await update.message.reply_text(f"You don't have enough points. You have {user_points}, but you tried to stake {points}. Please enter a valid amount.")
+        return STAKE_SUBMISSION_POINTS
+
+    if context.user_data.get('player_role') == 'opponent':
+        games_data[game_id]['opponent_stake'] = {"type": "points", "value": points}
+        # Saved together with the activation changes
+        return await _finalize_opponent_stake(context, game_id, games_data)
+
+    games_data[game_id]['challenger_stake'] = {"type": "points", "value": points}
+    save_games_data(games_data)
+    # Since opponent is already selected, go straight to confirmation
+    return await show_confirmation(update, context, games_data)
+
 async def stake_submission_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handles the submission of media as a stake."""
     logger.debug("In stake_submission_media")
@@ -2546,72 +3001,18 @@ async def stake_submission_media(update: Update, context: ContextTypes.DEFAULT_T
 
     if context.user_data.get('player_role') == 'opponent':
         games_data[game_id]['opponent_stake'] = {"type": media_type, "value": file_id}
-    else:
-        games_data[game_id]['challenger_stake'] = {"type": media_type, "value": file_id}
-    save_games_data(games_data)
-
-    if context.user_data.get('player_role') == 'opponent':
-        game = games_data[game_id]
-        if game['game_type'] == 'game_dice':
-            game['current_round'] = 1
-            game['challenger_score'] = 0
-            game['opponent_score'] = 0
-            game['last_roll'] = None
-        game['status'] = 'active'
-        save_games_data(games_data)
-        challenger = await context.bot.get_chat_member(game['group_id'], game['challenger_id'])
-        opponent = await context.bot.get_chat_member(game['group_id'], game['opponent_id'])
-        await context.bot.send_message(
-            chat_id=game['group_id'],
-            text=f"The game between {challenger.user.mention_html()} and {opponent.user.mention_html()} is on!",
-            parse_mode='HTML'
-        )
-
-        if game['game_type'] == 'game_connect_four':
-            challenger_member = await context.bot.get_chat_member(game['group_id'], game['challenger_id'])
-            board_text, reply_markup = create_connect_four_board_markup(game['board'], game_id)
-            await context.bot.send_message(
-                chat_id=game['group_id'],
-                text=f"<b>Connect Four!</b>\n\n{board_text}\nIt's {challenger_member.user.mention_html()}'s turn.",
-                reply_markup=reply_markup,
-                parse_mode='HTML'
-            )
-        elif game['game_type'] == 'game_battleship':
-            challenger_id = str(game['challenger_id'])
-            opponent_id = str(game['opponent_id'])
-            game['boards'] = {
-                challenger_id: [[0] * 10 for _ in range(10)],
-                opponent_id: [[0] * 10 for _ in range(10)]
-            }
-            game['ships'] = {challenger_id: {}, opponent_id: {}}
-            game['placement_complete'] = {challenger_id: False, opponent_id: False}
-            game['turn'] = game['challenger_id']
-            save_games_data(games_data)
-
-            placement_keyboard = [[InlineKeyboardButton("Begin Ship Placement", callback_data=f'bs_start_placement_{game_id}')]]
-            placement_markup = InlineKeyboardMarkup(placement_keyboard)
-            try:
-                await context.bot.send_message(
-                    chat_id=game['challenger_id'],
-                    text="Your Battleship game is ready! It's time to place your ships.",
-                    reply_markup=placement_markup
-                )
-                await context.bot.send_message(
-                    chat_id=game['opponent_id'],
-                    text="Your Battleship game is ready! It's time to place your ships.",
-                    reply_markup=placement_markup
-                )
-            except Exception:
-                logger.exception("Error sending battleship placement message")
+        # Saved together with the activation changes
+        return await _finalize_opponent_stake(context, game_id, games_data)
 
-        return ConversationHandler.END
-    else:
-        return await show_confirmation(update, context)
+    games_data[game_id]['challenger_stake'] = {"type": media_type, "value": file_id}
+    save_games_data(games_data)
+    return await show_confirmation(update, context, games_data)
 
-async def show_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Shows the confirmation message."""
+async def show_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE, games_data: dict = None) -> int:
+    """Shows the confirmation message. Callers that just saved the games can pass them in to skip a reload."""
     game_id = context.user_data['game_id']
-    games_data = load_games_data()
+    if games_data is None:
+        games_data = load_games_data()
     game = games_data[game_id]
 
     if context.user_data.get('player_role') == 'opponent':
@@ -2621,7 +3022,7 @@ async def show_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE)
         stake_type = game['challenger_stake']['type']
         stake_value = game['challenger_stake']['value']
 
-    opponent_member = await context.bot.get_chat_member(game['group_id'], game['opponent_id'])
+    opponent_member = await cached_get_chat_member(context.bot, game['group_id'], game['opponent_id'])
     opponent_name = get_display_name(opponent_member.user.id, opponent_member.user.full_name)
 
     confirmation_text = (
@@ -2632,10 +3033,11 @@ async def show_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE)
         f"Is this correct?"
     )
 
+    cb = get_game_callbacks(context, game_id)
     keyboard = [
-        [InlineKeyboardButton("Confirm", callback_data=f'confirm_game_{game_id}')],
-        [InlineKeyboardButton("Cancel", callback_data=f'cancel_game_{game_id}')],
-        [InlineKeyboardButton("Restart", callback_data=f'restart_game_{game_id}')],
+        [InlineKeyboardButton("Confirm", callback_data=cb['confirm'])],
+        [InlineKeyboardButton("Cancel", callback_data=cb['cancel'])],
+        [InlineKeyboardButton("Restart", callback_data=cb['restart'])],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
@@ -2660,15 +3062,9 @@ async def start_opponent_setup(update: Update, context: ContextTypes.DEFAULT_TYP
     context.user_data['game_id'] = game_id
     context.user_data['player_role'] = 'opponent'
 
-    keyboard = [
-        [InlineKeyboardButton("Points", callback_data='stake_points')],
-        [InlineKeyboardButton("Media (Photo, Video, Voice Note)", callback_data='stake_media')],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
     await update.message.reply_text(
         text="What would you like to stake?",
-        reply_markup=reply_markup
+        reply_markup=STAKE_TYPE_MARKUP
     )
     return STAKE_TYPE_SELECTION
 
@@ -2689,7 +3085,7 @@ async def confirm_game_setup(update: Update, context: ContextTypes.DEFAULT_TYPE)
     """Confirms the game setup and sends the challenge to the group."""
     query = update.callback_query
     await query.answer()
-    game_id = query.data.split('_')[-1]
+    game_id = context.match['game_id']
 
     games_data = load_games_data()
     game = games_data[game_id]
@@ -2697,8 +3093,8 @@ async def confirm_game_setup(update: Update, context: ContextTypes.DEFAULT_TYPE)
     game['status'] = 'pending_opponent_acceptance'
     save_games_data(games_data)
 
-    challenger_member = await context.bot.get_chat_member(game['group_id'], game['challenger_id'])
-    opponent_member = await context.bot.get_chat_member(game['group_id'], game['opponent_id'])
+    challenger_member = await cached_get_chat_member(context.bot, game['group_id'], game['challenger_id'])
+    opponent_member = await cached_get_chat_member(context.bot, game['group_id'], game['opponent_id'])
     challenger_name = get_display_name(challenger_member.user.id, challenger_member.user.full_name)
     opponent_name = get_display_name(opponent_member.user.id, opponent_member.user.full_name)
 
@@ -2708,10 +3104,11 @@ async def confirm_game_setup(update: Update, context: ContextTypes.DEFAULT_TYPE)
         f"{opponent_name}, do you accept?"
     )
 
+    cb = get_game_callbacks(context, game_id)
     keyboard = [
         [
-            InlineKeyboardButton("Accept", callback_data=f'accept_challenge_{game_id}'),
-            InlineKeyboardButton("Refuse", callback_data=f'refuse_challenge_{game_id}'),
+            InlineKeyboardButton("Accept", callback_data=cb['accept']),
+            InlineKeyboardButton("Refuse", callback_data=cb['refuse']),
         ]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -2738,18 +3135,10 @@ async def dice_roll_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     games_data = load_games_data()
 
-    active_game_id = None
-    active_game = None
-    for game_id, game in games_data.items():
-        if game.get('game_type') == 'game_dice' and \
-           game.get('status') == 'active' and \
-           (game.get('challenger_id') == user_id or game.get('opponent_id') == user_id):
-            active_game_id = game_id
-            active_game = game
-            break
-
-    if not active_game:
+    active_game_id = find_active_game_id(context, games_data, user_id, 'game_dice')
+    if not active_game_id:
         return
+    active_game = games_data[active_game_id]
 
     # This is a lot of logic for one function. I will break it down in the future if needed.
     last_roll = active_game.get('last_roll')
@@ -2758,8 +3147,7 @@ async def dice_roll_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         active_game['last_roll'] = {'user_id': user_id, 'value': update.message.dice.value}
         save_games_data(games_data)
         other_player_id = active_game['challenger_id'] if user_id == active_game['opponent_id'] else active_game['opponent_id']
-        other_player_member = await context.bot.get_chat_member(active_game['group_id'], other_player_id)
-        other_player_name = get_display_name(other_player_id, other_player_member.user.full_name)
+        other_player_name = await get_game_player_name(context, active_game, other_player_id)
         await update.message.reply_text(f"You rolled a {update.message.dice.value}. Waiting for {other_player_name} to roll.", parse_mode='HTML')
         return
 
@@ -2789,13 +3177,9 @@ async def dice_roll_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         active_game['opponent_score'] += 1
 
-    winner_member = await context.bot.get_chat_member(active_game['group_id'], winner_id)
-    winner_name = get_display_name(winner_id, winner_member.user.full_name)
-    win_message = f"{winner_name.capitalize()} wins round {active_game['current_round']}!\n" \
+    winner_name = await get_game_player_name(context, active_game, winner_id)
+    win_message = f"{player_subject(active_game, winner_id, winner_name)} wins round {active_game['current_round']}!\n" \
                   f"Score: {active_game['challenger_score']} - {active_game['opponent_score']}"
-    if 'fag' in winner_name:
-        win_message = f"The {winner_name} wins round {active_game['current_round']}!\n" \
-                      f"Score: {active_game['challenger_score']} - {active_game['opponent_score']}"
     await context.bot.send_message(
         chat_id=active_game['group_id'],
         text=win_message,
@@ -2825,34 +3209,22 @@ async def dice_roll_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             loser_stake = game['opponent_stake']
 
-        loser_member = await context.bot.get_chat_member(game['group_id'], loser_id)
-        winner_member = await context.bot.get_chat_member(game['group_id'], winner_id)
-
-        loser_name = get_display_name(loser_id, loser_member.user.full_name)
-        winner_name = get_display_name(winner_id, winner_member.user.full_name)
+        loser_name = await get_game_player_name(context, game, loser_id)
+        winner_name = await get_game_player_name(context, game, winner_id)
+        loser_subject = player_subject(game, loser_id, loser_name)
         if loser_stake['type'] == 'points':
             await add_user_points(game['group_id'], winner_id, loser_stake['value'], context)
             await add_user_points(game['group_id'], loser_id, -loser_stake['value'], context)
-            message = f"{loser_name.capitalize()} is a loser! They lost {loser_stake['value']} points to {winner_name}."
-            if 'fag' in loser_name:
-                message = f"The {loser_name} is a loser! They lost {loser_stake['value']} points to {winner_name}."
             await context.bot.send_message(
                 game['group_id'],
-                message,
+                f"{loser_subject} is a loser! They lost {loser_stake['value']} points to {winner_name}.",
                 parse_mode='HTML'
             )
         else:
-            caption = f"{loser_name.capitalize()} is a loser! This was their stake."
-            if 'fag' in loser_name:
-                caption = f"The {loser_name} is a loser! This was their stake."
-            if loser_stake['type'] == 'photo':
-                await context.bot.send_photo(game['group_id'], loser_stake['value'], caption=caption, parse_mode='HTML')
-            elif loser_stake['type'] == 'video':
-                await context.bot.send_video(game['group_id'], loser_stake['value'], caption=caption, parse_mode='HTML')
-            elif loser_stake['type'] == 'voice':
-                await context.bot.send_voice(game['group_id'], loser_stake['value'], caption=caption, parse_mode='HTML')
-
-        game['status'] = 'complete'
+            caption = f"{loser_subject} is a loser! This was their stake."
+            await send_stake_media(context.bot, game['group_id'], loser_stake, caption)
+
+        mark_game_complete(game)
         save_games_data(games_data)
     else:
         # Next round
@@ -2869,7 +3241,8 @@ async def challenge_response_handler(update: Update, context: ContextTypes.DEFAU
     query = update.callback_query
     await query.answer()
 
-    response_type, game_id = query.data.rsplit('_', 1)
+    response_type = context.match['response']
+    game_id = context.match['game_id']
 
     games_data = load_games_data()
     game = games_data.get(game_id)
@@ -2883,7 +3256,7 @@ async def challenge_response_handler(update: Update, context: ContextTypes.DEFAU
         await query.answer("This challenge is not for you.", show_alert=True)
         return
 
-    if response_type == 'accept_challenge':
+    if response_type == 'accept':
         game['status'] = 'pending_opponent_stake'
         save_games_data(games_data)
 
@@ -2897,11 +3270,11 @@ async def challenge_response_handler(update: Update, context: ContextTypes.DEFAU
             reply_markup=reply_markup
         )
 
-    elif response_type == 'refuse_challenge':
+    elif response_type == 'refuse':
         challenger_id = game['challenger_id']
         challenger_stake = game['challenger_stake']
 
-        challenger_member = await context.bot.get_chat_member(game['group_id'], challenger_id)
+        challenger_member = await cached_get_chat_member(context.bot, game['group_id'], challenger_id)
         challenger_name = get_display_name(challenger_id, challenger_member.user.full_name)
 
         await context.bot.send_message(
@@ -2909,25 +3282,16 @@ async def challenge_response_handler(update: Update, context: ContextTypes.DEFAU
             text=f"Your challenge was refused by {get_display_name(update.effective_user.id, update.effective_user.full_name)}."
         )
 
+        challenger_subject = player_subject(game, challenger_id, challenger_name)
         if challenger_stake['type'] == 'points':
-            message = f"{challenger_name.capitalize()} is a loser for being refused! They lost {challenger_stake['value']} points."
-            if 'fag' in challenger_name:
-                message = f"The {challenger_name} is a loser for being refused! They lost {challenger_stake['value']} points."
             await context.bot.send_message(
                 game['group_id'],
-                message,
+                f"{challenger_subject} is a loser for being refused! They lost {challenger_stake['value']} points.",
                 parse_mode='HTML'
             )
         else:
-            caption = f"{challenger_name.capitalize()} is a loser for being refused! This was their stake."
-            if 'fag' in challenger_name:
-                caption = f"The {challenger_name} is a loser for being refused! This was their stake."
-            if challenger_stake['type'] == 'photo':
-                await context.bot.send_photo(game['group_id'], challenger_stake['value'], caption=caption, parse_mode='HTML')
-            elif challenger_stake['type'] == 'video':
-                await context.bot.send_video(game['group_id'], challenger_stake['value'], caption=caption, parse_mode='HTML')
-            elif challenger_stake['type'] == 'voice':
-                await context.bot.send_voice(game['group_id'], challenger_stake['value'], caption=caption, parse_mode='HTML')
+            caption = f"{challenger_subject} is a loser for being refused! This was their stake."
+            await send_stake_media(context.bot, game['group_id'], challenger_stake, caption)
 
         del games_data[game_id]
         save_games_data(games_data)
@@ -2975,12 +3339,13 @@ async def check_and_kick_inactive_users(app):
     settings = load_inactive_settings()
     activity = load_activity_data()
     now = int(time.time())
-    for group_id, days in settings.items():
+    # Snapshot, since /inactive can change the settings while this loop awaits
+    for group_id, days in list(settings.items()):
         group_activity = activity.get(group_id, {})
         threshold = now - days * 86400
         try:
             bot = app.bot
-            admins = await bot.get_chat_administrators(int(group_id))
+            admins = await cached_get_admins(bot, group_id)
             admin_ids = {str(admin.user.id) for admin in admins}
             members = list(group_activity.keys())
             for user_id in members:
@@ -2997,25 +3362,117 @@ async def check_and_kick_inactive_users(app):
         except Exception as e:
             logger.error(f"Failed to process group {group_id} for inactivity kicking: {e}")
 
+# =============================
+# Conversation Filter
+# =============================
+# Conversation flows in priority order: the first state key present in user_data handles the reply
+CONVERSATION_STATE_HANDLERS = (
+    (ADDREWARD_COST_STATE, handle_addreward_cost),
+    (ADDREWARD_STATE, handle_addreward_name),
+    (REMOVEREWARD_STATE, handle_removereward_name),
+    (REWARD_STATE, handle_reward_choice),
+    (ADDPOINTS_STATE, handle_addpoints_value),
+    (REMOVEPOINTS_STATE, handle_removepoints_value),
+    (FREE_REWARD_SELECTION, handle_free_reward_choice),
+    (ASK_TASK_TARGET, handle_ask_task_target),
+    (ASK_TASK_DESCRIPTION, handle_ask_task_description),
+    (ADMIN_HELP_STATE, handle_admin_help_reason),
+)
+
+# user_data keys that mean conversation_handler has a pending step for the user
+CONVERSATION_STATE_KEYS = frozenset(state_key for state_key, _ in CONVERSATION_STATE_HANDLERS)
+# A pending step older than this (seconds) is ignored, so a conversation abandoned long ago
+# (possibly before a restart, as user_data is persisted) doesn't swallow the user's next message
+CONVERSATION_STATE_TTL = 3600
+# user_data key holding when the user's latest conversation step was set
+CONVERSATION_STEP_AT = 'conversation_step_at'
+
+def conversation_expired(user_data) -> bool:
+    """Whether the user's pending conversation step, if any, is older than CONVERSATION_STATE_TTL."""
+    return time.time() - user_data.get(CONVERSATION_STEP_AT, 0) > CONVERSATION_STATE_TTL
+
+def set_conversation_step(context: ContextTypes.DEFAULT_TYPE, state_key, value):
+    """Stores the user's next conversation step, first dropping any steps left from an expired conversation."""
+    user_data = context.user_data
+    if conversation_expired(user_data):
+        for key in CONVERSATION_STATE_KEYS:
+            user_data.pop(key, None)
+    user_data[state_key] = value
+    user_data[CONVERSATION_STEP_AT] = time.time()
+
+class ActiveConversationFilter(filters.MessageFilter):
+    """Passes only messages from users with a conversation_handler step pending in their user_data."""
+
+    def __init__(self, app: Application):
+        super().__init__(name='ActiveConversationFilter')
+        self._user_data = app.user_data
+
+    def filter(self, message) -> bool:
+        if not message.from_user:
+            return False
+        # .get() on the read-only view doesn't create an entry for users we haven't seen
+        data = self._user_data.get(message.from_user.id)
+        return bool(data) and not CONVERSATION_STATE_KEYS.isdisjoint(data) and not conversation_expired(data)
+
+
+# =============================
+# Callback Query Routing
+# =============================
+# Callback handlers outside the conversations, keyed by the first '_'-separated token of the callback data
+CALLBACK_ROUTES = {
+    'accept': [(re.compile(CHALLENGE_RESPONSE_PATTERN), challenge_response_handler)],
+    'refuse': [(re.compile(CHALLENGE_RESPONSE_PATTERN), challenge_response_handler)],
+    'c4': [(re.compile(C4_MOVE_PATTERN), connect_four_move_handler)],
+    'bs': [
+        (re.compile(BS_LEGACY_COL_PATTERN), bs_legacy_col_handler),
+        (re.compile(BS_ATTACK_PATTERN), bs_attack_handler),
+    ],
+    'help': [(re.compile(r'^help_'), help_menu_handler)],
+}
+
+def is_routed_callback(data) -> bool:
+    """Cheap prefix check used as the router's CallbackQueryHandler pattern."""
+    return isinstance(data, str) and data.split('_', 1)[0] in CALLBACK_ROUTES
+
+async def callback_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Runs the handler whose pattern matches the callback data, exposing the match as context.match."""
+    data = update.callback_query.data
+    for pattern, handler in CALLBACK_ROUTES[data.split('_', 1)[0]]:
+        match = pattern.match(data)
+        if match:
+            context.matches = [match]
+            await handler(update, context)
+            return
+    logger.debug(f"No callback route matched {data!r}")
+
 # =============================
 # Command Registration Helper
 # =============================
+# Handlers for the . and ! command prefixes, keyed by command name
+_PREFIX_HANDLERS = {}
+
 def add_command(app: Application, command: str, handler):
     """
     Registers a command with support for /, ., and ! prefixes.
+    The . and ! forms are served by the single handler added in register_prefix_commands.
     """
-    # Wrapper for MessageHandlers to populate context.args
-    async def message_handler_wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if update.message and update.message.text:
-            context.args = update.message.text.split()[1:]
-        await handler(update, context)
-
     # Register for /<command> - uses the original handler as it populates args automatically
     app.add_handler(CommandHandler(command, handler))
+    _PREFIX_HANDLERS[command] = handler
 
-    # Register for .<command> and !<command> - uses the wrapper
-    app.add_handler(MessageHandler(filters.Regex(rf'^\.{command}(\s|$)'), message_handler_wrapper))
-    app.add_handler(MessageHandler(filters.Regex(rf'^!{command}(\s|$)'), message_handler_wrapper))
+async def _prefix_dispatch(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Routes a .<command> or !<command> message to its handler, populating context.args."""
+    handler = _PREFIX_HANDLERS[context.match.group(1)]
+    if update.message and update.message.text:
+        # Split off the command first so argument-less commands skip building a word list
+        parts = update.message.text.split(None, 1)
+        context.args = parts[1].split() if len(parts) == 2 else []
+    await handler(update, context)
+
+def register_prefix_commands(app: Application):
+    """Registers one handler with a single combined regex for every command added through add_command."""
+    names = '|'.join(re.escape(command) for command in _PREFIX_HANDLERS)
+    app.add_handler(MessageHandler(filters.Regex(re.compile(rf'^[.!]({names})(?:\s|$)')), _prefix_dispatch))
 
 
 if __name__ == '__main__':
@@ -3025,11 +3482,33 @@ if __name__ == '__main__':
     async def periodic_inactive_check_job(context: ContextTypes.DEFAULT_TYPE):
         await check_and_kick_inactive_users(context.application)
 
+    async def flush_json_job(context: ContextTypes.DEFAULT_TYPE):
+        await flush_dirty_json()
+
     async def on_startup(app):
         # Schedule the periodic job using the job queue (every hour)
         app.job_queue.run_repeating(periodic_inactive_check_job, interval=3600, first=10)
+        # Write out deferred points/activity/cooldown changes
+        app.job_queue.run_repeating(flush_json_job, interval=JSON_FLUSH_INTERVAL)
 
-    app = Application.builder().token(TOKEN).post_init(on_startup).build()
+    async def on_shutdown(app):
+        await flush_dirty_json()
+
+    # Only user_data holds conversation state; bot_data's indexes are rebuilt from the JSON files
+    persistence = PicklePersistence(
+        PERSISTENCE_FILE,
+        store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+        update_interval=30,
+    )
+    app = (
+        Application.builder()
+        .token(TOKEN)
+        .persistence(persistence)
+        .concurrent_updates(PerChatUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
 
     #Commands
     # Register all commands using the new helper
@@ -3057,32 +3536,33 @@ if __name__ == '__main__':
     add_command(app, 'point', point_command)
     add_command(app, 'top5', top5_command)
     add_command(app, 'setnickname', setnickname_command)
+    register_prefix_commands(app)
 
     # Add the conversation handler with a high priority
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, conversation_handler), group=-1)
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND & ActiveConversationFilter(app), conversation_handler), group=-1)
 
     game_setup_handler = ConversationHandler(
         entry_points=[
-            CallbackQueryHandler(start_game_setup, pattern='^start_game_setup_'),
+            CallbackQueryHandler(start_game_setup, pattern=START_GAME_SETUP_PATTERN),
             CommandHandler('start', start_opponent_setup, filters=filters.Regex('^setstake_'))
         ],
         states={
-            GAME_SELECTION: [CallbackQueryHandler(game_selection)],
-            ROUND_SELECTION: [CallbackQueryHandler(round_selection)],
-            STAKE_TYPE_SELECTION: [CallbackQueryHandler(stake_type_selection)],
+            GAME_SELECTION: [CallbackQueryHandler(game_selection, pattern=GAME_SELECTION_PATTERN)],
+            ROUND_SELECTION: [CallbackQueryHandler(round_selection, pattern=ROUND_SELECTION_PATTERN)],
+            STAKE_TYPE_SELECTION: [CallbackQueryHandler(stake_type_selection, pattern=STAKE_TYPE_PATTERN)],
             STAKE_SUBMISSION_POINTS: [MessageHandler(filters.TEXT & ~filters.COMMAND, stake_submission_points)],
             STAKE_SUBMISSION_MEDIA: [MessageHandler(filters.PHOTO | filters.VIDEO | filters.VOICE, stake_submission_media)],
             CONFIRMATION: [
-                CallbackQueryHandler(confirm_game_setup, pattern='^confirm_game_'),
-                CallbackQueryHandler(restart_game_setup, pattern='^restart_game_'),
-                CallbackQueryHandler(cancel_game_setup, pattern='^cancel_game_'),
+                CallbackQueryHandler(confirm_game_setup, pattern=CONFIRM_GAME_PATTERN),
+                CallbackQueryHandler(restart_game_setup, pattern=RESTART_GAME_PATTERN),
+                CallbackQueryHandler(cancel_game_setup, pattern=CANCEL_GAME_PATTERN),
             ],
         },
-        fallbacks=[CallbackQueryHandler(cancel_game_setup, pattern='^cancel_game_')],
+        fallbacks=[CallbackQueryHandler(cancel_game_setup, pattern=CANCEL_GAME_PATTERN)],
     )
     # Battleship placement handler
     battleship_placement_handler = ConversationHandler(
-        entry_points=[CallbackQueryHandler(bs_start_placement, pattern='^bs_start_placement_')],
+        entry_points=[CallbackQueryHandler(bs_start_placement, pattern=BS_START_PLACEMENT_PATTERN)],
         states={
             BS_AWAITING_PLACEMENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, bs_handle_placement)],
         },
@@ -3092,12 +3572,10 @@ if __name__ == '__main__':
     app.add_handler(battleship_placement_handler)
 
     app.add_handler(game_setup_handler)
-    app.add_handler(CallbackQueryHandler(challenge_response_handler, pattern='^(accept_challenge_|refuse_challenge_)'))
-    app.add_handler(CallbackQueryHandler(connect_four_move_handler, pattern=r'^c4_move_'))
-    app.add_handler(CallbackQueryHandler(bs_select_col_handler, pattern=r'^bs_col_'))
-    app.add_handler(CallbackQueryHandler(bs_attack_handler, pattern=r'^bs_attack_'))
-    app.add_handler(CallbackQueryHandler(help_menu_handler, pattern=r'^help_'))
+    # Challenge, Connect Four, Battleship and help buttons all go through one routed handler
+    app.add_handler(CallbackQueryHandler(callback_router, pattern=is_routed_callback))
     app.add_handler(MessageHandler(filters.Dice, dice_roll_handler))
+    app.add_handler(ChatMemberHandler(chat_member_update_handler, ChatMemberHandler.CHAT_MEMBER))
 
     # Fallback handler for dynamic hashtag commands.
     # The group=1 makes it lower priority than the static commands registered with add_command (which are in the default group 0)
@@ -3121,4 +3599,10 @@ if __name__ == '__main__':
 
     #Check for updates
     logger.info('Polling...')
-    app.run_polling(poll_interval=0.5)
\ No newline at end of file
+    # Long polling: Telegram holds each getUpdates open for up to 20s until updates arrive.
+    # chat_member updates are opt-in; they keep the cached admin lists current.
+    app.run_polling(
+        poll_interval=0,
+        timeout=20,
+        allowed_updates=[Update.MESSAGE, Update.EDITED_MESSAGE, Update.CALLBACK_QUERY, Update.CHAT_MEMBER],
+    )
\ No newline at end of file